@@ -26,6 +26,7 @@ import tempfile
 import base64
 import json
 import subprocess
+import uuid
 
 import sublime, sublime_plugin
 
@@ -36,118 +37,451 @@ sys.path.append(os.path.join(DIR_OF_THIS_SCRIPT, "ycmd"))
 sys.path.append(os.path.join(DIR_OF_THIS_SCRIPT, "ycmd", "third_party",
                              "frozendict"))
 
-from SublimeYouCompleteMe.plugin import utils, sublime_support
+import requests
+
+from SublimeYouCompleteMe.plugin import utils, sublime_support, settings, \
+     buffer_sync, ycmd_transport
 from SublimeYouCompleteMe.plugin.ycmd_request import YCMDRequest, \
      YCMDEventNotification, YCMDCommandRequest, YCMDCompletionRequest
 from SublimeYouCompleteMe.plugin.ycmd_keepalive import YCMDKeepAlive
+from SublimeYouCompleteMe.plugin.parse_scheduler import ParseScheduler
+from SublimeYouCompleteMe.plugin.ycmd_startup import ServerStartup, \
+     DEFAULT_MAX_WAITING, wait_until_ready
+from SublimeYouCompleteMe.plugin.ycmd_supervisor import ServerSupervisor
+from SublimeYouCompleteMe.plugin.ycmd_server_pool import ServerPool, \
+     DEFAULT_MAX_SERVERS, DEFAULT_MIN_IDLE_SECONDS
+from SublimeYouCompleteMe.plugin.ycmd_warm_spare import WARM_SPARE
 
 
 SERVER_IDLE_SUICIDE_SECONDS = 300
+SERVER_STARTUP_TIMEOUT_SECONDS = 30
+WARM_SPARE_CHECK_INTERVAL_SECONDS = 0.1
 FORCE_NEXT_COMPLETION_SEMANTIC = False
 IDLE_DETECTION_TIMER = None
+# Set when YCMD didn't start on a unix domain socket, servers use TCP then
+UNIX_SOCKET_FAILED = False
+
+class ServerProcess(object):
+    """ A started YCMD server process. Requests are sent to base_uri and
+    signed with hmac_secret.
+    """
+    def __init__(self, popen, base_uri, hmac_secret, unix_socket_path=None):
+        self._popen = popen
+        self._unix_socket_path = unix_socket_path
+        self.base_uri = base_uri
+        self.hmac_secret = hmac_secret
+
+    def uses_unix_socket(self):
+        """ Does the server listen on a unix domain socket? """
+        return self._unix_socket_path is not None
+
+    def is_alive(self):
+        """ Test if the server process is alive """
+        # When the process hasn't finished yet, poll() returns None.
+        return self._popen.poll() is None
+
+    def terminate(self):
+        """ Stop the process if it still runs, and remove its unix socket """
+        if self.is_alive():
+            self._popen.terminate()
+        if self._unix_socket_path:
+            ycmd_transport.stop_using_unix_socket(YCMDRequest.session,
+                                                  self.base_uri)
+            try:
+                os.remove(self._unix_socket_path)
+            except OSError:
+                pass
+
+
+def spawn_server_process(user_options):
+    """ Start a YCMD server process. On linux it listens on a unix domain
+    socket unless the use_unix_socket setting is false or a server didn't
+    start on one before, otherwise on a TCP port. Returns a ServerProcess,
+    which may not take requests yet.
+    """
+    unix_socket_path = None
+    if settings.SETTINGS.get("use_unix_socket", True) and \
+       not UNIX_SOCKET_FAILED and ycmd_transport.unix_sockets_supported():
+        name = uuid.uuid4().hex
+        unix_socket_path = os.path.join(
+            tempfile.gettempdir(),
+            "ycmd_{0}_{1}.sock".format(os.getpid(), name))
+        base_uri = ycmd_transport.unix_socket_base_uri("ycmd-" + name)
+        command = [utils.path_to_python(),
+                   os.path.join(DIR_OF_THIS_SCRIPT, "plugin",
+                                "ycmd_unix_socket_launcher.py"),
+                   unix_socket_path,
+                   os.path.join("ycmd", "ycmd")]
+    else:
+        port = utils.get_unused_localhost_port()
+        base_uri = "http://127.0.0.1:{0}".format(port)
+        command = [utils.path_to_python(),
+                   os.path.join("ycmd", "ycmd"),
+                   "--port={0}".format(port)]
+
+    with tempfile.NamedTemporaryFile(mode="w", delete=False) as options_file:
+        # This file is deleted by YCMD when it starts
+        hmac_secret = os.urandom(16)
+        options_dict = user_options.copy()
+        options_dict["hmac_secret"] = base64.b64encode(hmac_secret).\
+            decode(encoding="utf-8")
+        json.dump(options_dict, options_file)
+        options_file.flush()
+
+        command += ["--options_file={0}".format(options_file.name),
+                   # '--log={0}'.format( self._user_options[ 'server_log_level' ] ),
+                   "--idle_suicide_seconds={0}".format(
+                        SERVER_IDLE_SUICIDE_SECONDS)]
+
+    # if not self._user_options[ 'server_use_vim_stdout' ]:
+    #   filename_format = os.path.join( utils.PathToTempDir(),
+    #                                   'server_{port}_{std}.log' )
+
+    #   self._server_stdout = filename_format.format( port = server_port,
+    #                                                 std = 'stdout' )
+    #   self._server_stderr = filename_format.format( port = server_port,
+    #                                                 std = 'stderr' )
+    #   args.append('--stdout={0}'.format( self._server_stdout ))
+    #   args.append('--stderr={0}'.format( self._server_stderr ))
+
+    #   if self._user_options[ 'server_keep_logfiles' ]:
+    #     args.append('--keep_logfiles')
+
+    popen = subprocess.Popen(command,
+                             stdout=None, # subprocess.PIPE
+                             stderr=None, # subprocess.PIPE
+                             cwd=DIR_OF_THIS_SCRIPT)
+    if unix_socket_path:
+        ycmd_transport.use_unix_socket(YCMDRequest.session, unix_socket_path,
+                                       base_uri)
+    return ServerProcess(popen, base_uri, hmac_secret, unix_socket_path)
+
+
+def server_process_is_ready(process):
+    """ Ask a server whether it is healthy and its completers are ready.
+    Versions of YCMD without the ready handler are ready when healthy.
+    """
+    if not YCMDRequest.probe_handler("healthy", process):
+        return False
+    try:
+        return YCMDRequest.probe_handler("ready", process)
+    except requests.HTTPError as error:
+        if error.response.status_code == requests.codes.not_found:
+            return True
+        raise
+
 
 class SublimeYouCompleteMe(object):
-    """ A wrapper for the YCMD server """
-    def __init__(self, user_options):
+    """ A wrapper for the YCMD server of one project, see ServerPool.
+    The server is started in a background thread by the first request that
+    needs it, see the startup attribute. Requests are sent to base_uri and
+    signed with hmac_secret. When replaces_server is True, an earlier server
+    of the project was shut down and the state of the client is restored
+    when this one starts.
+    When the warm_spare_server setting is true, a server that starts takes
+    the process of the warm spare if one is ready, see WarmSpare.
+    """
+    def __init__(self, user_options, key, key_of_file, extra_conf_decisions,
+                 replaces_server=False):
         self._user_options = user_options
-        self._server_popen = None
+        self._key_of_file = key_of_file
+        self._process = None # the ServerProcess
+        self.key = key
+        # .ycm_extra_conf.py path -> True if the user loaded it, False if
+        # ignored. Shared with the other servers of the project.
+        self.extra_conf_decisions = extra_conf_decisions
+        self._keep_alive_thread = YCMDKeepAlive(self)
+        if settings.SETTINGS.get("warm_spare_server", False):
+            # Taking over the spare is immediate, so notice the exit of the
+            # server sooner and start with a short backoff.
+            self._supervisor = ServerSupervisor(
+                self._needs_restart, self._restart_server,
+                check_interval_seconds=WARM_SPARE_CHECK_INTERVAL_SECONDS,
+                min_backoff_seconds=WARM_SPARE_CHECK_INTERVAL_SECONDS)
+        else:
+            self._supervisor = ServerSupervisor(self._needs_restart,
+                                                self._restart_server)
+        self._threads_started = False
+        self._has_been_ready = replaces_server
+        self._shut_down = False
+        self.startup = ServerStartup(
+            self._start_server,
+            settings.SETTINGS.get("startup_queue_size", DEFAULT_MAX_WAITING))
+
+    def _start_server(self):
+        """ Start the server and keep it alive, runs in the startup thread.
+        Returns once the server answers that it is ready. When it replaces
+        an earlier server, the state of that server is restored first.
+        """
+        if not self._threads_started:
+            self._threads_started = True
+            self._keep_alive_thread.start()
+            self._supervisor.start()
+
         self._setup_server()
-        self._keep_alive_thread = YCMDKeepAlive()
-        self._keep_alive_thread.start()
+        try:
+            self._wait_until_ready()
+        except Exception as error:
+            if not self._process.uses_unix_socket():
+                raise
+            global UNIX_SOCKET_FAILED
+            UNIX_SOCKET_FAILED = True
+            print("YCMD didn't start on a unix domain socket ({0}), using "
+                  "TCP instead".format(error))
+            self._process = spawn_server_process(self._user_options)
+            self._wait_until_ready()
+        if self._shut_down:
+            # The plugin was unloaded or the server was shut down as idle
+            # while it was starting
+            self.server_shutdown()
+            raise RuntimeError("The server was shut down")
+
+        if self._has_been_ready:
+            self._restore_server_state()
+        self._has_been_ready = True
+
+    def _wait_until_ready(self):
+        """ Wait until the server process takes requests, or terminate it
+        when it doesn't.
+        """
+        try:
+            wait_until_ready(lambda: server_process_is_ready(self._process),
+                             self.is_server_alive,
+                             SERVER_STARTUP_TIMEOUT_SECONDS)
+        except Exception:
+            self._process.terminate()
+            raise
+
+    def _needs_restart(self):
+        """ Did the server exit or fail to start, while it is still needed?
+        Called by the supervisor.
+        """
+        if self._shut_down or not self.startup.is_started():
+            return False
+        ready = self.startup.ready()
+        if not ready.done():
+            return False
+        return ready.exception() is not None or not self.is_server_alive()
+
+    def _restart_server(self):
+        """ Start a new server and wait until it is ready. Called by the
+        supervisor, requests are held until the new server is ready.
+        """
+        if self._process:
+            self._process.terminate()
+        self.startup.restart().exception()
+
+    def _restore_server_state(self):
+        """ Bring a restarted server up to date before the held requests are
+        released. The extra conf decisions of the user are repeated, and the
+        open files of its project are parsed again, forgetting what the
+        client remembered of the previous server about them.
+        """
+        YCMDEventNotification.replay_extra_conf_decisions(self)
+
+        def reparse_open_buffers():
+            parsed_buffer_ids = set()
+            for window in sublime.windows():
+                for view in window.views():
+                    if not view.file_name() or \
+                       view.buffer_id() in parsed_buffer_ids or \
+                       self._key_of_file(view.file_name()) != self.key:
+                        continue
+                    parsed_buffer_ids.add(view.buffer_id())
+                    buffer_sync.invalidate(view.buffer_id())
+                    YCMDCompletionRequest.cache.invalidate(view.buffer_id())
+                    YCMDEventNotification("FileReadyToParse",
+                                          sublime_view=view)
+        sublime.set_timeout(reparse_open_buffers, 0)
+
+    @property
+    def base_uri(self):
+        """ The URI the server listens on """
+        return self._process.base_uri if self._process else ""
+
+    @property
+    def hmac_secret(self):
+        """ The secret to sign the requests to the server with """
+        return self._process.hmac_secret if self._process else b""
 
     def _setup_server(self):
-        """ Start the YCMD server """
-        port = utils.get_unused_localhost_port()
-        with tempfile.NamedTemporaryFile(mode="w", delete=False) as options_file:
-            # This file is deleted by YCMD when it starts
-            hmac_secret = os.urandom(16)
-            options_dict = self._user_options.copy()
-            options_dict["hmac_secret"] = base64.b64encode(hmac_secret).\
-                decode(encoding="utf-8")
-            json.dump(options_dict, options_file)
-            options_file.flush()
-
-            command = [utils.path_to_python(),
-                       os.path.join("ycmd", "ycmd"),
-                       "--port={0}".format(port),
-                       "--options_file={0}".format(options_file.name),
-                       # '--log={0}'.format( self._user_options[ 'server_log_level' ] ),
-                       "--idle_suicide_seconds={0}".format(
-                            SERVER_IDLE_SUICIDE_SECONDS)]
-
-        # if not self._user_options[ 'server_use_vim_stdout' ]:
-        #   filename_format = os.path.join( utils.PathToTempDir(),
-        #                                   'server_{port}_{std}.log' )
-
-        #   self._server_stdout = filename_format.format( port = server_port,
-        #                                                 std = 'stdout' )
-        #   self._server_stderr = filename_format.format( port = server_port,
-        #                                                 std = 'stderr' )
-        #   args.append('--stdout={0}'.format( self._server_stdout ))
-        #   args.append('--stderr={0}'.format( self._server_stderr ))
-
-        #   if self._user_options[ 'server_keep_logfiles' ]:
-        #     args.append('--keep_logfiles')
-
-        self._server_popen = subprocess.Popen(command,
-                                              stdout=None, # subprocess.PIPE
-                                              stderr=None, # subprocess.PIPE
-                                              cwd=DIR_OF_THIS_SCRIPT)
-        YCMDRequest.server_base_URI = "http://127.0.0.1:{0}".format(port)
-        YCMDRequest.shared_hmac_secret = hmac_secret
-
+        """ Start the YCMD server, or take over the warm spare """
+        self._process = None # the previous one was terminated
+        process = None
+        if settings.SETTINGS.get("warm_spare_server", False):
+            process = WARM_SPARE.take()
+            if process:
+                print("Took over the warm spare YCMD")
+        self._process = process or spawn_server_process(self._user_options)
 
     def is_server_alive(self):
         """ Test if the server process is alive """
-        # When the process hasn't finished yet, poll() returns None.
-        return self._server_popen.poll() is None
+        return self._process is not None and self._process.is_alive()
 
 
     def server_shutdown(self):
         """ Shutdown the server """
-        if self.is_server_alive():
-            self._server_popen.terminate()
-            self._keep_alive_thread.stop()
+        self._shut_down = True
+        self._keep_alive_thread.stop()
+        self._supervisor.stop()
+        if self._process:
+            self._process.terminate()
 
 
 from ycmd import user_options_store #temporary till the settings module is fleshed out
-SERVER_WRAP = SublimeYouCompleteMe(user_options_store.DefaultOptions())
+
+def _project_key_of_file(file_path):
+    """ The key of the server pool, one server per project unless the
+    server_per_project setting is false.
+    """
+    if not settings.SETTINGS.get("server_per_project", True):
+        return ""
+    return sublime_support.project_key_of_file(file_path)
+
+def _create_server(key):
+    """ A new server for the project of the key, see ServerPool """
+    server = SublimeYouCompleteMe(user_options_store.DefaultOptions(), key,
+                                  _project_key_of_file,
+                                  EXTRA_CONF_DECISIONS.setdefault(key, {}),
+                                  replaces_server=key in SERVER_KEYS)
+    SERVER_KEYS.append(key)
+    return server
+
+SERVER_KEYS = [] # the key of every server that was created
+EXTRA_CONF_DECISIONS = {} # key -> the extra conf decisions of its servers
+# Its limits are read from the settings in plugin_loaded
+SERVER_POOL = ServerPool(_create_server, _project_key_of_file)
+YCMDRequest.server_pool = SERVER_POOL
+
+# What the client remembers of the servers before a reload is lost with
+# them, their files are parsed again by the new servers.
+buffer_sync.invalidate()
+YCMDCompletionRequest.cache.invalidate()
+
+def plugin_loaded():
+    """ This function is called by Sublime Text once its API is ready and
+    the settings can be read.
+    """
+    YCMDRequest.start_session()
+    YCMDEventNotification.configure_cache()
+    SERVER_POOL.configure(
+        settings.SETTINGS.get("max_servers", DEFAULT_MAX_SERVERS),
+        settings.SETTINGS.get("server_idle_seconds", DEFAULT_MIN_IDLE_SECONDS))
+    if settings.SETTINGS.get("warm_spare_server", False):
+        WARM_SPARE.enable(
+            lambda: spawn_server_process(user_options_store.DefaultOptions()),
+            server_process_is_ready)
+    else:
+        WARM_SPARE.disable()
 
 def unload_handler():
     """ This function is called by Sublime Text when this plugin is unloaded
     or reloaded. Unfortunately it is not called when Sublime Text exits.
+    The warm spare is released: a reloaded plugin takes it over, otherwise
+    it is shut down after a grace period. When Sublime Text exits, YCMD
+    shuts itself down once it isn't pinged anymore.
     """
-    SERVER_WRAP.server_shutdown()
+    SERVER_POOL.shutdown()
+    WARM_SPARE.release()
 
 class YCMEventListener(sublime_plugin.EventListener):
     """ Listener for events that Sublime Text sends us."""
     def __init__(self):
-        self._file_parse_events = []
-        self._timer_running = False
+        self._parse_scheduler = ParseScheduler()
+        # (view id, change count, location) of the async completion request
+        # we are waiting for, and the completions that are ready to be shown.
+        self._pending_completions_key = None
+        self._ready_completions = None
 
     def on_query_completions(self, view, prefix, locations):
         """ Gives completions to Sublime Text """
         global FORCE_NEXT_COMPLETION_SEMANTIC
-        ret = (YCMDCompletionRequest.send(view,
-                    force_semantic=FORCE_NEXT_COMPLETION_SEMANTIC),
-               sublime.INHIBIT_WORD_COMPLETIONS |
-               sublime.INHIBIT_EXPLICIT_COMPLETIONS)
+        force_semantic = FORCE_NEXT_COMPLETION_SEMANTIC
         FORCE_NEXT_COMPLETION_SEMANTIC = False
-        return ret
+        flags = sublime.INHIBIT_WORD_COMPLETIONS | \
+                sublime.INHIBIT_EXPLICIT_COMPLETIONS
+
+        if not settings.SETTINGS.get("async_completions", True):
+            return (YCMDCompletionRequest.send(view,
+                        force_semantic=force_semantic),
+                    flags)
+        return (self._query_completions_async(view, locations[0],
+                                              force_semantic),
+                flags)
+
+    def _query_completions_async(self, view, location, force_semantic):
+        """ Returns the completions for this location if an earlier async
+        request already fetched them. Otherwise a request is started in the
+        background and an empty list is returned, the auto complete popup is
+        reopened when YCMD answers.
+        """
+        key = (view.id(), view.change_count(), location)
+        if not force_semantic and self._ready_completions and \
+           self._ready_completions[0] == key:
+            completions = self._ready_completions[1]
+            self._ready_completions = None
+            return completions
+
+        if not force_semantic:
+            completions = YCMDCompletionRequest.completions_from_cache(view)
+            if completions is not None:
+                self._pending_completions_key = None
+                return completions
+
+        self._ready_completions = None
+        self._pending_completions_key = key
+
+        def on_completions(completions):
+            sublime.set_timeout(lambda: self._show_async_completions(
+                                    view, key, completions),
+                                0)
+
+        YCMDCompletionRequest.send_async(view, on_completions,
+                                         force_semantic=force_semantic)
+        return []
+
+    def _show_async_completions(self, view, key, completions):
+        """ Reopen the auto complete popup with the completions of an async
+        request. Results are dropped when a newer request was made or the
+        cursor has moved on since the request was sent.
+        """
+        if key != self._pending_completions_key:
+            return
+        self._pending_completions_key = None
+
+        if not completions or not view.is_valid() or not view.sel():
+            return
+        current_key = (view.id(), view.change_count(), view.sel()[0].begin())
+        if current_key != key:
+            return
+
+        self._ready_completions = (key, completions)
+        view.run_command("hide_auto_complete")
+        view.run_command("auto_complete", {"disable_auto_insert": True,
+                                           "api_completions_only": True,
+                                           "next_completion_if_showing": False})
 
     def on_load(self, view):
-        """ Notify ycmd to parse the loaded file """
+        """ Notify ycmd to parse the loaded file. Diagnostics of an earlier
+        parse of the same contents are shown until the parse is done.
+        """
         if not view or not view.file_name():
             return
 
-        YCMDEventNotification("FileReadyToParse", sublime_view=view)
+        YCMDEventNotification.show_cached_diagnostics(view)
+        self._parse_scheduler.schedule(view, delay_ms=0)
+
+    def on_clone(self, view):
+        """ Show the diagnostics of the buffer in the new view of it """
+        if not view or not view.file_name():
+            return
+        YCMDEventNotification.show_cached_diagnostics(view)
 
     def on_modified(self, view):
         """ Called when a buffer is modified. We let YCMD reparse the file """
         if not view or not view.file_name():
             return
-        # Note: Maybe we have to add a delay for fast typists with slow cpu's?
-        YCMDEventNotification("FileReadyToParse", sublime_view=view)
+        self._parse_scheduler.schedule(view)
 
         global IDLE_DETECTION_TIMER
         if not IDLE_DETECTION_TIMER or (not IDLE_DETECTION_TIMER.isAlive()):
@@ -162,6 +496,11 @@ class YCMEventListener(sublime_plugin.EventListener):
     def on_close(self, view):
         """ Called when a view is closed """
         sublime_support.clear_view_from_diagnostics_store(view)
+        if not sublime_support.buffer_has_other_views(view):
+            buffer_sync.forget_buffer(view.buffer_id())
+            YCMDCompletionRequest.cache.forget_buffer(view.buffer_id())
+            YCMDRequest.generations.forget_buffer(view.buffer_id())
+            self._parse_scheduler.forget_buffer(view.buffer_id())
 
 
 class YcmGotoCommand(sublime_plugin.TextCommand):
@@ -174,6 +513,46 @@ class YcmGotoHistoryCommand(sublime_plugin.TextCommand):
         sublime_support.jump_back(self.view)
 
 
+class YcmNextDiagnosticCommand(sublime_plugin.TextCommand):
+    def run(self, edit):
+        sublime_support.jump_to_diagnostic(self.view, forward=True)
+
+
+class YcmPreviousDiagnosticCommand(sublime_plugin.TextCommand):
+    def run(self, edit):
+        sublime_support.jump_to_diagnostic(self.view, forward=False)
+
+
+class YcmShowSyncStatsCommand(sublime_plugin.TextCommand):
+    def run(self, edit):
+        """ Show how much buffer data was sent to YCMD for this view """
+        stats = buffer_sync.get_stats(self.view.buffer_id())
+        print("YCMD buffer sync {0}: {1}".format(self.view.file_name(), stats))
+        print("YCMD diagnostics cache: {0}".format(
+            YCMDEventNotification.diagnostics_cache.stats()))
+        sublime.status_message("YCMD buffer sync: {0}".format(stats))
+
+
+class YcmShowTransportStatsCommand(sublime_plugin.TextCommand):
+    def run(self, edit):
+        """ Show how well connections to YCMD are reused and how requests
+        wait in the priority lanes.
+        """
+        stats = ycmd_transport.connection_stats(YCMDRequest.session)
+        lanes = ycmd_transport.lane_stats(YCMDRequest.session)
+        print("YCMD transport: {0}\nYCMD lanes: {1}".format(stats, lanes))
+        print("YCMD servers: {0}".format(SERVER_POOL.stats()))
+        print("YCMD warm spare: {0}".format(WARM_SPARE.stats()))
+        for server in SERVER_POOL.servers():
+            print("YCMD startup of {0}: {1}".format(
+                server.key or "files outside projects",
+                server.startup.stats()))
+        print("YCMD superseded requests: {0} cancelled, {1} discarded".format(
+            YCMDRequest.generations.cancelled,
+            YCMDRequest.generations.discarded))
+        sublime.status_message("YCMD transport: {0}".format(stats))
+
+
 class YcmAutoCompleteCommand(sublime_plugin.TextCommand):
     def run(self, edit):
         """ Perform a normal sublime text auto_complete, but force YCMD to do
@@ -0,0 +1,170 @@
+# Copyright (C) 2014 Ivan Koster
+# 
+# This file is part of SublimeYouCompleteMe.
+# 
+# SublimeYouCompleteMe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# SublimeYouCompleteMe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with SublimeYouCompleteMe.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Keeps track of the buffer contents that are sent to the YCMD server.
+
+YCMD has no way to receive only the changes of a file, every request that
+carries file_data needs the complete contents. What we can avoid is reading
+the whole buffer out of sublime text again when nothing changed since the
+last request. Sublime gives every buffer a change count that is increased on
+each modification, this module keeps the last snapshot per buffer_id and only
+takes a new one when the change count differs.
+
+It also counts how many bytes are sent per buffer, so you can see what a
+keystroke costs with the ycm_show_sync_stats command.
+
+Every snapshot has a cheap hash of its contents. The hash and diagnostics of
+the last successful parse of each buffer are kept, so a FileReadyToParse for
+contents YCMD has already parsed (after an undo/redo round trip or a reload)
+can be answered locally.
+"""
+import threading
+
+import sublime
+
+_LOCK = threading.Lock()
+_SNAPSHOTS = {}
+_BUFFER_ID_BY_FILEPATH = {}
+_STATS = {}
+_PARSED = {} # buffer_id -> (content hash, diagnostics)
+
+
+class BufferSnapshot(object):
+    """ The contents of a buffer at a certain change count """
+    def __init__(self, buffer_id, change_count, file_path, contents):
+        self.buffer_id = buffer_id
+        self.change_count = change_count
+        self.file_path = file_path
+        self.contents = contents
+        # Python caches the hash of a string, this only costs one pass over
+        # the contents. It is only compared within this process.
+        self.content_hash = (len(contents), hash(contents))
+
+
+class BufferSyncStats(object):
+    """ Counters about the data that is sent to YCMD for one buffer """
+    def __init__(self):
+        self.edits = 0
+        self.snapshots_taken = 0
+        self.snapshots_reused = 0
+        self.requests = 0
+        self.bytes_sent = 0
+        self.parses_skipped = 0
+
+    def bytes_per_edit(self):
+        """ The average amount of bytes sent to YCMD per modification """
+        if not self.edits:
+            return 0
+        return self.bytes_sent // self.edits
+
+    def __str__(self):
+        return ("{0} edits, {1} requests, {2} bytes sent ({3} per edit), "
+                "{4} snapshots taken, {5} reused, {6} parses of unchanged "
+                "contents skipped").format(
+                    self.edits, self.requests, self.bytes_sent,
+                    self.bytes_per_edit(), self.snapshots_taken,
+                    self.snapshots_reused, self.parses_skipped)
+
+
+def snapshot(view):
+    """ Returns a BufferSnapshot with the current contents of the view.
+    The contents are only read from the view if it was modified since the
+    previous snapshot of its buffer.
+    Must be called from the main thread.
+    """
+    buffer_id = view.buffer_id()
+    change_count = view.change_count()
+    with _LOCK:
+        previous = _SNAPSHOTS.get(buffer_id, None)
+        stats = _STATS.setdefault(buffer_id, BufferSyncStats())
+        if previous and previous.change_count == change_count and \
+           previous.file_path == view.file_name():
+            stats.snapshots_reused += 1
+            return previous
+
+    current = BufferSnapshot(buffer_id, change_count, view.file_name(),
+                             view.substr(sublime.Region(0, view.size())))
+    with _LOCK:
+        if previous and change_count > previous.change_count:
+            stats.edits += change_count - previous.change_count
+        stats.snapshots_taken += 1
+        _SNAPSHOTS[buffer_id] = current
+        _BUFFER_ID_BY_FILEPATH[current.file_path] = buffer_id
+    return current
+
+
+def record_request(file_path, payload_size):
+    """ Account a request of payload_size bytes that was sent to YCMD
+    for the buffer of the given file.
+    """
+    with _LOCK:
+        buffer_id = _BUFFER_ID_BY_FILEPATH.get(file_path, None)
+        if buffer_id is None:
+            return
+        stats = _STATS.setdefault(buffer_id, BufferSyncStats())
+        stats.requests += 1
+        stats.bytes_sent += payload_size
+
+
+def record_parse(buffer_id, content_hash, diagnostics):
+    """ Remember the diagnostics of a successful parse of the contents with
+    the given hash.
+    """
+    with _LOCK:
+        _PARSED[buffer_id] = (content_hash, diagnostics)
+
+
+def diagnostics_of_parse(buffer_id, content_hash):
+    """ Returns the diagnostics of the last parse of the buffer if it parsed
+    the same contents, otherwise None.
+    """
+    with _LOCK:
+        parsed = _PARSED.get(buffer_id, None)
+        if not parsed or parsed[0] != content_hash:
+            return None
+        _STATS.setdefault(buffer_id, BufferSyncStats()).parses_skipped += 1
+        return parsed[1]
+
+
+def get_stats(buffer_id):
+    """ Returns the BufferSyncStats of a buffer """
+    with _LOCK:
+        return _STATS.get(buffer_id, BufferSyncStats())
+
+
+def invalidate(buffer_id=None):
+    """ Forget the snapshot and last parse of a buffer, or of all buffers
+    when no buffer_id is given. The next request takes a fresh snapshot of
+    the whole buffer and it will be parsed again.
+    """
+    with _LOCK:
+        if buffer_id is None:
+            _SNAPSHOTS.clear()
+            _PARSED.clear()
+        else:
+            _SNAPSHOTS.pop(buffer_id, None)
+            _PARSED.pop(buffer_id, None)
+
+
+def forget_buffer(buffer_id):
+    """ Remove everything that is known about a buffer """
+    with _LOCK:
+        snapshot_ = _SNAPSHOTS.pop(buffer_id, None)
+        _STATS.pop(buffer_id, None)
+        _PARSED.pop(buffer_id, None)
+        if snapshot_:
+            _BUFFER_ID_BY_FILEPATH.pop(snapshot_.file_path, None)
@@ -0,0 +1,170 @@
+# Copyright (C) 2014 Ivan Koster
+# 
+# This file is part of SublimeYouCompleteMe.
+# 
+# SublimeYouCompleteMe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# SublimeYouCompleteMe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with SublimeYouCompleteMe.  If not, see <http://www.gnu.org/licenses/>.
+
+""" See the CompletionCache class """
+import re
+import threading
+
+import sublime
+
+from SublimeYouCompleteMe.plugin.fuzzy_matcher import CandidateIndex
+
+IDENTIFIER_CHAR = re.compile(r"\w", re.UNICODE)
+# The default min_num_of_chars_for_completion of YCMD. Its identifier
+# completer returns nothing for shorter queries.
+DEFAULT_MIN_QUERY_LENGTH = 2
+# Member access triggers after which YCMD uses the semantic completer
+SEMANTIC_TRIGGERS = (".", "->", "::")
+
+
+class CompletionQuery(object):
+    """ The position completions are requested for and the part of the
+    identifier that was typed so far.
+    start_column is 1-based, like the completion_start_column YCMD returns.
+    context is the text on the line before start_column.
+    """
+    def __init__(self, buffer_id, line, start_column, context, query):
+        self.buffer_id = buffer_id
+        self.line = line
+        self.start_column = start_column
+        self.context = context
+        self.query = query
+
+    @staticmethod
+    def from_view(view):
+        """ Build the query for the first cursor of the view.
+        Must be called from the main thread.
+        """
+        cursor_position = view.sel()[0].begin()
+        line, column = view.rowcol(cursor_position)
+        line_text = view.substr(sublime.Region(
+            view.line(cursor_position).begin(), cursor_position))
+        start = len(line_text)
+        while start > 0 and IDENTIFIER_CHAR.match(line_text[start - 1]):
+            start -= 1
+        return CompletionQuery(view.buffer_id(), line, start + 1,
+                               line_text[:start], line_text[start:])
+
+    def same_start(self, other):
+        """ Do both queries complete the identifier at the same place? """
+        return self.buffer_id == other.buffer_id and \
+               self.line == other.line and \
+               self.start_column == other.start_column and \
+               self.context == other.context
+
+    def after_semantic_trigger(self):
+        """ Does the query start right after a member access like foo. or
+        foo->?
+        """
+        return self.context.endswith(SEMANTIC_TRIGGERS)
+
+
+class CompletionCache(object):
+    """ Remembers the last candidates YCMD returned per buffer.
+
+    While the user keeps typing the same identifier, the query start stays the
+    same and the query only grows. The cached candidates are then filtered
+    and ranked locally by the fuzzy matcher instead of asking YCMD again. The
+    cache of a buffer is not used anymore as soon as the query starts
+    somewhere else, the text before the query start changed or the buffer was
+    invalidated.
+
+    Only candidates that are known to be complete are cached: not an empty
+    list, not a list that was cut off at a maximum number of candidates and
+    not the identifier candidates of a query shorter than min_query_length,
+    the min_num_of_chars_for_completion option of YCMD. Refiltering those
+    locally would hide candidates YCMD returns for the longer query. Semantic
+    candidates are complete for any query, like the members after foo.
+    """
+    def __init__(self, min_query_length=DEFAULT_MIN_QUERY_LENGTH):
+        self._min_query_length = min_query_length
+        self._lock = threading.Lock()
+        self._entries = {} # buffer_id -> (query, generation, CandidateIndex)
+        self._generations = {}
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self, buffer_id):
+        """ The current generation of a buffer, it changes every time the
+        buffer is invalidated.
+        """
+        with self._lock:
+            return self._generations.get(buffer_id, 0)
+
+    def store(self, query, generation, completion_start_column, candidates,
+              complete=True, semantic=False):
+        """ Store the candidates YCMD returned for a query that was sent in
+        the given generation of the buffer. They are only cached when YCMD
+        agrees on where the query starts, the buffer wasn't invalidated in
+        the meantime and the candidates are complete. complete is False when
+        YCMD or the client capped the amount of candidates. semantic is True
+        when a semantic completion was forced.
+        """
+        semantic = semantic or query.after_semantic_trigger()
+        if not complete or not candidates or \
+           (not semantic and len(query.query) < self._min_query_length) or \
+           completion_start_column != query.start_column:
+            with self._lock:
+                # Longer queries must not be answered from an older entry
+                self._entries.pop(query.buffer_id, None)
+            return
+        index = CandidateIndex(candidates, key=lambda candidate:
+                                               candidate["insertion_text"])
+        with self._lock:
+            if generation != self._generations.get(query.buffer_id, 0):
+                return
+            self._entries[query.buffer_id] = (query, generation, index)
+
+    def lookup(self, query, limit=None):
+        """ Returns the cached candidates that match the query, or None if the
+        cache can't answer it and YCMD has to be asked. With a limit only the
+        best limit candidates are returned, selected with a heap instead of
+        sorting all matches.
+        """
+        with self._lock:
+            entry = self._entries.get(query.buffer_id, None)
+            generation = self._generations.get(query.buffer_id, 0)
+            if not entry or entry[1] != generation or \
+               not entry[0].same_start(query) or \
+               not query.query.startswith(entry[0].query):
+                self.misses += 1
+                return None
+            self.hits += 1
+            index = entry[2]
+
+        return index.filter_and_rank(query.query, limit)
+
+    def invalidate(self, buffer_id=None):
+        """ Stop using the cached candidates of a buffer, or of all buffers
+        when no buffer_id is given.
+        """
+        with self._lock:
+            if buffer_id is None:
+                buffer_ids = set(self._generations) | set(self._entries)
+            else:
+                buffer_ids = [buffer_id]
+            for buffer_id in buffer_ids:
+                self._generations[buffer_id] = \
+                    self._generations.get(buffer_id, 0) + 1
+                self._entries.pop(buffer_id, None)
+
+    def forget_buffer(self, buffer_id):
+        """ Remove everything that is cached for a buffer """
+        with self._lock:
+            self._generations.pop(buffer_id, None)
+            self._entries.pop(buffer_id, None)
+
@@ -0,0 +1,105 @@
+# Copyright (C) 2014 Ivan Koster
+# 
+# This file is part of SublimeYouCompleteMe.
+# 
+# SublimeYouCompleteMe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# SublimeYouCompleteMe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with SublimeYouCompleteMe.  If not, see <http://www.gnu.org/licenses/>.
+
+""" See the DiagnosticsCache class """
+from collections import OrderedDict
+import threading
+
+from SublimeYouCompleteMe.plugin import ycmd_json
+
+DEFAULT_MAX_KB = 4096
+
+
+class DiagnosticsCache(object):
+    """ Remembers the diagnostics of recent parses per file and contents,
+    independent of the views that show them.
+
+    When a file is opened again, or in another view, its diagnostics can be
+    shown right away if its contents didn't change since they were parsed.
+    The least recently used entries are evicted once the cache holds more
+    than max_bytes, an entry is counted as the size of its diagnostics in
+    JSON.
+    """
+    def __init__(self, max_bytes):
+        self._lock = threading.Lock()
+        # (file_path, content_hash) -> (size, diagnostics), oldest first
+        self._entries = OrderedDict()
+        self._max_bytes = max_bytes
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def store(self, file_path, content_hash, diagnostics):
+        """ Remember the diagnostics of a parse of the file with the contents
+        of the given hash.
+        """
+        if diagnostics is None:
+            return
+        size = len(ycmd_json.dumps(diagnostics))
+        key = (file_path, content_hash)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous:
+                self._size -= previous[0]
+            if size > self._max_bytes:
+                return
+            self._entries[key] = (size, diagnostics)
+            self._size += size
+            self._evict()
+
+    def resize(self, max_bytes):
+        """ Hold at most max_bytes from now on """
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        # Called with the lock held
+        while self._size > self._max_bytes:
+            _, (evicted_size, _) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+            self.evictions += 1
+
+    def lookup(self, file_path, content_hash):
+        """ Returns the diagnostics of the file with these contents, or None
+        if they aren't cached.
+        """
+        key = (file_path, content_hash)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def stats(self):
+        """ A readable line about the size and use of the cache """
+        with self._lock:
+            return "{0} files, {1:.1f} of {2:.1f} KB, {3} hits, {4} misses, " \
+                   "{5} evicted".format(len(self._entries),
+                                        self._size / 1024.0,
+                                        self._max_bytes / 1024.0, self.hits,
+                                        self.misses, self.evictions)
+
+    def clear(self):
+        """ Forget all cached diagnostics """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
@@ -0,0 +1,144 @@
+# Copyright (C) 2014 Ivan Koster
+# 
+# This file is part of SublimeYouCompleteMe.
+# 
+# SublimeYouCompleteMe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# SublimeYouCompleteMe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with SublimeYouCompleteMe.  If not, see <http://www.gnu.org/licenses/>.
+
+""" See the DiagnosticIndex class.
+
+Run this module with python to time building and querying an index of a
+file with many warnings.
+"""
+import bisect
+
+
+class Diagnostic(object):
+    """ A diagnostic from YCMD, on the region begin - end of a view. It is
+    drawn as the region with region_index in the regions of region_key.
+    """
+    def __init__(self, begin, end, kind, text, region_key=None,
+                 region_index=None):
+        self.begin = begin
+        self.end = end
+        self.kind = kind
+        self.text = text
+        self.region_key = region_key
+        self.region_index = region_index
+
+    @property
+    def message(self):
+        """ The text shown to the user """
+        return "{0}: {1}".format(self.kind, self.text)
+
+
+class DiagnosticIndex(object):
+    """ The diagnostics of one view, sorted by where they begin.
+
+    Next to the begin points it keeps the running maximum of the end points,
+    so a search for the diagnostics at a point or range can stop as soon as
+    no earlier diagnostic reaches that far. Diagnostics mostly cover a
+    single word, so a query is a binary search plus a few steps.
+
+    change_count is the change count of the view the positions belong to.
+    """
+    def __init__(self, diagnostics=(), change_count=None):
+        self.change_count = change_count
+        self._diagnostics = sorted(diagnostics,
+                                   key=lambda diag: (diag.begin, diag.end))
+        self._begins = [diag.begin for diag in self._diagnostics]
+        self._max_ends = []
+        max_end = -1
+        for diag in self._diagnostics:
+            max_end = max(max_end, diag.end)
+            self._max_ends.append(max_end)
+
+    def __len__(self):
+        return len(self._diagnostics)
+
+    def __iter__(self):
+        return iter(self._diagnostics)
+
+    def at(self, point):
+        """ The diagnostics whose region contains the point, including its
+        begin and end.
+        """
+        return self.overlapping(point, point)
+
+    def overlapping(self, begin, end):
+        """ The diagnostics whose region overlaps begin - end, in order """
+        index = bisect.bisect_right(self._begins, end)
+        found = []
+        while index > 0 and self._max_ends[index - 1] >= begin:
+            index -= 1
+            if self._diagnostics[index].end >= begin:
+                found.append(self._diagnostics[index])
+        found.reverse()
+        return found
+
+    def next_after(self, point):
+        """ The first diagnostic that begins after the point, or None """
+        index = bisect.bisect_right(self._begins, point)
+        if index < len(self._diagnostics):
+            return self._diagnostics[index]
+        return None
+
+    def previous_before(self, point):
+        """ The last diagnostic that begins before the point, or None """
+        index = bisect.bisect_left(self._begins, point)
+        if index > 0:
+            return self._diagnostics[index - 1]
+        return None
+
+    def first(self):
+        """ The diagnostic that begins first, or None """
+        return self._diagnostics[0] if self._diagnostics else None
+
+    def last(self):
+        """ The diagnostic that begins last, or None """
+        return self._diagnostics[-1] if self._diagnostics else None
+
+
+def benchmark(num_diagnostics=10000, queries=10000):
+    """ Build an index of many word sized diagnostics and time point
+    queries and navigation on it.
+    """
+    import random
+    import time
+
+    random.seed(0)
+    diagnostics = []
+    for _ in range(num_diagnostics):
+        begin = random.randrange(0, 40 * num_diagnostics)
+        diagnostics.append(Diagnostic(begin, begin + random.randrange(1, 20),
+                                      "WARNING", "unused variable"))
+    points = [random.randrange(0, 40 * num_diagnostics)
+              for _ in range(queries)]
+
+    start = time.perf_counter()
+    index = DiagnosticIndex(diagnostics)
+    print("{0} diagnostics, index built in {1:.2f} ms".format(
+        num_diagnostics, (time.perf_counter() - start) * 1000))
+
+    for name, query in [("at", index.at),
+                        ("next_after", index.next_after),
+                        ("previous_before", index.previous_before)]:
+        start = time.perf_counter()
+        for point in points:
+            query(point)
+        print("{0:16} {1:6.2f} us per query".format(
+            name, (time.perf_counter() - start) / queries * 1e6))
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,206 @@
+# Copyright (C) 2014 Ivan Koster
+# 
+# This file is part of SublimeYouCompleteMe.
+# 
+# SublimeYouCompleteMe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# SublimeYouCompleteMe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with SublimeYouCompleteMe.  If not, see <http://www.gnu.org/licenses/>.
+
+""" A subsequence matcher that filters and ranks completion candidates
+locally, in a way that resembles how YCMD does it.
+
+A candidate matches a query when the characters of the query appear in the
+candidate in the same order. Matching ignores case, except for the uppercase
+characters in the query ("smart case"). Matches are ranked by:
+    1. the query being a prefix of the candidate
+    2. how many of the query characters hit word boundaries, i.e. the first
+       character, characters after an underscore and camelCase humps
+    3. the length of the candidate
+    4. the candidate text itself
+
+Run this module with python to benchmark it against a generated corpus.
+"""
+import bisect
+import heapq
+import re
+
+# The query is matched against all candidates with one regex search over the
+# joined candidates, so matching runs in the regex engine instead of a python
+# loop per candidate. The separator must not be in a candidate.
+_SEPARATOR = "\n"
+
+
+def word_boundary_chars(text):
+    """ Returns the lowercased characters of text that start a word """
+    boundaries = []
+    previous = ""
+    for char in text:
+        if not previous or \
+           (char.isalnum() and not previous.isalnum()) or \
+           (char.isupper() and previous.islower()):
+            boundaries.append(char)
+        previous = char
+    return "".join(boundaries).lower()
+
+
+class CandidateIndex(object):
+    """ Precomputed lowercase text and word boundaries of a list of
+    candidates, to match and rank them quickly for many queries.
+    Pass a key function if the candidates aren't strings themselves.
+    """
+    def __init__(self, candidates, key=None):
+        self.candidates = candidates
+        self._texts = [key(candidate) for candidate in candidates] if key \
+                      else list(candidates)
+        self._lower = [text.lower().replace(_SEPARATOR, " ")
+                       for text in self._texts]
+        self._boundaries = [None] * len(self._texts)
+
+        self._corpus = _SEPARATOR.join(self._lower)
+        self._offsets = []
+        offset = 0
+        for lower in self._lower:
+            self._offsets.append(offset)
+            offset += len(lower) + len(_SEPARATOR)
+
+    def __len__(self):
+        return len(self.candidates)
+
+    def filter_and_rank(self, query, limit=None):
+        """ Returns the candidates that match the query, best match first.
+        With a limit only the best limit candidates are returned.
+        """
+        indexes = self._matching_indexes(query)
+        if not query:
+            ranked = indexes[:limit] if limit else indexes
+        elif limit and limit < len(indexes):
+            ranked = heapq.nsmallest(limit, indexes,
+                                     key=self._sort_key_function(query))
+        else:
+            ranked = sorted(indexes, key=self._sort_key_function(query))
+        return [self.candidates[index] for index in ranked]
+
+    def _matching_indexes(self, query):
+        if not query:
+            return list(range(len(self._texts)))
+
+        # Without anchoring the pattern to the start of a candidate, the
+        # regex engine can skip ahead to the first query char on its own.
+        pattern = re.compile("[^\n]*?".join(map(re.escape, query.lower())))
+        offsets = self._offsets
+        indexes = []
+        last_index = -1
+        for match in pattern.finditer(self._corpus):
+            index = bisect.bisect_right(offsets, match.start()) - 1
+            if index != last_index:
+                indexes.append(index)
+                last_index = index
+
+        if query != query.lower():
+            texts = self._texts
+            indexes = [index for index in indexes
+                       if _smart_case_match(texts[index], query)]
+        return indexes
+
+    def _sort_key_function(self, query):
+        lower_query = query.lower()
+        texts = self._texts
+        lowers = self._lower
+        boundaries = self._boundaries
+
+        def sort_key(index):
+            boundary_chars = boundaries[index]
+            if boundary_chars is None:
+                boundary_chars = word_boundary_chars(texts[index])
+                boundaries[index] = boundary_chars
+            return (not lowers[index].startswith(lower_query),
+                    -_matched_prefix_length(boundary_chars, lower_query),
+                    len(lowers[index]),
+                    texts[index])
+        return sort_key
+
+
+def _smart_case_match(text, query):
+    """ Subsequence match where uppercase query characters only match
+    uppercase characters.
+    """
+    position = 0
+    for char in query:
+        if char.isupper():
+            position = text.find(char, position) + 1
+        else:
+            lower_found = text.find(char, position) + 1
+            upper_found = text.find(char.upper(), position) + 1
+            position = min(lower_found, upper_found) or \
+                       max(lower_found, upper_found)
+        if not position:
+            return False
+    return True
+
+
+def _matched_prefix_length(text, query):
+    """ How many characters at the start of query are a subsequence of
+    text.
+    """
+    position = 0
+    for count, char in enumerate(query):
+        position = text.find(char, position) + 1
+        if not position:
+            return count
+    return len(query)
+
+
+def benchmark(candidate_count=10000, rounds=20):
+    """ Time matching and ranking of a corpus of generated C++ and python
+    style identifiers and print the results.
+    """
+    import random
+    import time
+
+    words = ["get", "set", "buffer", "file", "name", "path", "request", "data",
+             "server", "handler", "view", "region", "size", "count", "index",
+             "parse", "token", "string", "vector", "map", "node", "tree",
+             "visit", "update", "create", "destroy", "value", "type", "list",
+             "item", "cursor", "line", "column", "diagnostic", "completion",
+             "cache", "query", "result", "event", "listener", "manager"]
+    styles = [lambda parts: "_".join(parts),
+              lambda parts: parts[0] + "".join(p.title() for p in parts[1:]),
+              lambda parts: "".join(p.title() for p in parts),
+              lambda parts: "m_" + parts[0] + "".join(p.title()
+                                                      for p in parts[1:]),
+              lambda parts: "k" + "".join(p.title() for p in parts)]
+    generator = random.Random(0)
+    corpus = set()
+    while len(corpus) < candidate_count:
+        parts = generator.sample(words, generator.randint(1, 4))
+        corpus.add(generator.choice(styles)(parts))
+    corpus = [{"insertion_text": text} for text in sorted(corpus)]
+
+    start = time.perf_counter()
+    index = CandidateIndex(corpus, key=lambda candidate:
+                                       candidate["insertion_text"])
+    build_ms = (time.perf_counter() - start) * 1000
+    print("{0} candidates, index built in {1:.2f} ms".format(len(index),
+                                                             build_ms))
+
+    for query in ["g", "gb", "gbn", "getBuf", "smp", "mbuffer", "xyz"]:
+        for limit in [None, 50]:
+            start = time.perf_counter()
+            for _ in range(rounds):
+                result = index.filter_and_rank(query, limit)
+            elapsed_ms = (time.perf_counter() - start) * 1000 / rounds
+            print("query {0!r:10} limit {1!s:5} {2:6} matches "
+                  "{3:7.2f} ms".format(query, limit, len(result), elapsed_ms))
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,168 @@
+# Copyright (C) 2014 Ivan Koster
+# 
+# This file is part of SublimeYouCompleteMe.
+# 
+# SublimeYouCompleteMe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# SublimeYouCompleteMe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with SublimeYouCompleteMe.  If not, see <http://www.gnu.org/licenses/>.
+
+""" See the ParseScheduler class """
+import sublime
+
+from SublimeYouCompleteMe.plugin import settings, sublime_support
+from SublimeYouCompleteMe.plugin.ycmd_request import YCMDEventNotification
+
+DEFAULT_DEBOUNCE_MS = 250
+DEFAULT_MIN_DEBOUNCE_MS = 50
+DEFAULT_MAX_DEBOUNCE_MS = 2000
+
+
+class ParseLatencyTracker(object):
+    """ Keeps an exponential moving average of the FileReadyToParse round-trip
+    times per file and per filetype.
+    """
+    def __init__(self, smoothing=0.3):
+        self._smoothing = smoothing
+        self._per_file = {}
+        self._per_filetype = {}
+
+    def record(self, file_path, filetype, latency_ms):
+        """ Add an observed round-trip time """
+        self._update(self._per_file, file_path, latency_ms)
+        self._update(self._per_filetype, filetype, latency_ms)
+
+    def estimate(self, file_path, filetype):
+        """ The expected round-trip time in ms for a parse of the file. Falls
+        back to the average of the filetype for files that were not parsed
+        yet, returns None when nothing is known.
+        """
+        latency = self._per_file.get(file_path, None)
+        if latency is None:
+            latency = self._per_filetype.get(filetype, None)
+        return latency
+
+    def _update(self, averages, key, latency_ms):
+        previous = averages.get(key, None)
+        if previous is None:
+            averages[key] = latency_ms
+        else:
+            averages[key] = previous + self._smoothing * (latency_ms - previous)
+
+
+class ParseScheduler(object):
+    """ Decides when YCMD is asked to reparse a buffer.
+
+    Every modification of a buffer schedules a FileReadyToParse notification
+    after a debounce window. A modification within that window replaces the
+    scheduled notification, so only the latest snapshot of the buffer is sent.
+    There is never more than one parse in flight per buffer: when a parse is
+    due while the previous one is still running, the new one is sent as soon
+    as the running one finishes. A previous parse that is still waiting in the
+    request queue is cancelled instead.
+
+    The debounce window adapts to how long YCMD needs to parse the file, so a
+    small script gets its diagnostics right away while a heavy translation
+    unit isn't reparsed faster than the server can keep up with. It is kept
+    between the parse_debounce_min_ms and parse_debounce_max_ms settings.
+
+    All methods must be called from the main thread.
+    """
+    def __init__(self):
+        self._next_token = 0
+        self._scheduled = {} # buffer_id -> token of the scheduled parse
+        self._in_flight = {} # buffer_id -> YCMDEventNotification
+        self._parse_after_in_flight = set()
+        self._latency_tracker = ParseLatencyTracker()
+
+    def schedule(self, view, delay_ms=None):
+        """ Schedule a reparse of the buffer of the view. Without delay_ms the
+        debounce window is used.
+        """
+        if delay_ms is None:
+            delay_ms = self.debounce_ms(view)
+        buffer_id = view.buffer_id()
+        self._next_token += 1
+        token = self._next_token
+        self._scheduled[buffer_id] = token
+        sublime.set_timeout(lambda: self._on_debounce_expired(buffer_id, token),
+                            delay_ms)
+
+    def debounce_ms(self, view):
+        """ The debounce window for the view, based on the observed parse
+        times of its file or filetype.
+        """
+        default = settings.SETTINGS.get("parse_debounce_ms",
+                                        DEFAULT_DEBOUNCE_MS)
+        if not settings.SETTINGS.get("adaptive_parse_debounce", True):
+            return default
+
+        latency = self._latency_tracker.estimate(
+            view.file_name(), sublime_support.get_ycmd_filetype(view))
+        if latency is None:
+            return default
+        minimum = settings.SETTINGS.get("parse_debounce_min_ms",
+                                        DEFAULT_MIN_DEBOUNCE_MS)
+        maximum = settings.SETTINGS.get("parse_debounce_max_ms",
+                                        DEFAULT_MAX_DEBOUNCE_MS)
+        return int(min(max(latency, minimum), maximum))
+
+    def forget_buffer(self, buffer_id):
+        """ Drop the scheduled parse of a buffer """
+        self._scheduled.pop(buffer_id, None)
+        self._parse_after_in_flight.discard(buffer_id)
+
+    def _on_debounce_expired(self, buffer_id, token):
+        if self._scheduled.get(buffer_id, None) != token:
+            return # A newer modification rescheduled the parse
+        del self._scheduled[buffer_id]
+
+        in_flight = self._in_flight.get(buffer_id, None)
+        if in_flight and not in_flight.future.cancel():
+            self._parse_after_in_flight.add(buffer_id)
+            return
+        self._send_parse(buffer_id)
+
+    def _send_parse(self, buffer_id):
+        view = sublime_support.find_view_by_buffer_id(buffer_id)
+        if not view or not view.file_name():
+            self._in_flight.pop(buffer_id, None)
+            return
+
+        file_path = view.file_name()
+        filetype = sublime_support.get_ycmd_filetype(view)
+        notification = YCMDEventNotification("FileReadyToParse",
+                                             sublime_view=view)
+        self._in_flight[buffer_id] = notification
+
+        def on_done(future):
+            if not notification.skipped and not future.cancelled() and \
+               not future.exception():
+                # The time from sending the request until YCMD answered.
+                # Waiting for the server to start or in the request queue
+                # isn't part of the parse.
+                latency_ms = future.result().elapsed.total_seconds() * 1000
+                sublime.set_timeout(lambda: self._latency_tracker.record(
+                                        file_path, filetype, latency_ms),
+                                    0)
+            sublime.set_timeout(
+                lambda: self._on_parse_done(buffer_id, notification), 0)
+
+        notification.future.add_done_callback(on_done)
+
+    def _on_parse_done(self, buffer_id, notification):
+        if self._in_flight.get(buffer_id, None) is not notification:
+            return # A cancelled parse that was already replaced
+        del self._in_flight[buffer_id]
+
+        if buffer_id in self._parse_after_in_flight:
+            self._parse_after_in_flight.discard(buffer_id)
+            self._send_parse(buffer_id)
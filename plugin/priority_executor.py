@@ -0,0 +1,165 @@
+# Copyright (C) 2014 Ivan Koster
+# 
+# This file is part of SublimeYouCompleteMe.
+# 
+# SublimeYouCompleteMe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# SublimeYouCompleteMe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with SublimeYouCompleteMe.  If not, see <http://www.gnu.org/licenses/>.
+
+""" See the PriorityThreadPoolExecutor class """
+from collections import deque
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+import threading
+import time
+
+# Lanes in order of priority, a lower number goes first.
+LANE_INTERACTIVE = 0 # completions and commands the user waits for
+LANE_PARSE = 1 # FileReadyToParse and other event notifications
+LANE_BACKGROUND = 2 # health checks and keep alive pings
+LANE_NAMES = {LANE_INTERACTIVE: "interactive",
+              LANE_PARSE: "parse",
+              LANE_BACKGROUND: "background"}
+
+
+class LaneStats(object):
+    """ Counters about the work items that went through one lane """
+    def __init__(self):
+        self.submitted = 0
+        self.started = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def average_wait(self):
+        """ Average seconds a work item waited in the queue """
+        if not self.started:
+            return 0.0
+        return self.total_wait / self.started
+
+
+class _WorkItem(object):
+    def __init__(self, future, fn, args, kwargs):
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.enqueue_time = time.monotonic()
+
+    def run(self):
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except BaseException as error:
+            self.future.set_exception(error)
+        else:
+            self.future.set_result(result)
+
+
+class PriorityThreadPoolExecutor(Executor):
+    """ A thread pool that keeps a queue per priority lane. An idle worker
+    always takes the oldest work item of the most important lane that has
+    work, so a burst of reparses can't delay a completion request.
+
+    submit() puts work in the lane of the calling thread, which is
+    LANE_INTERACTIVE unless it was changed with the lane() context manager:
+
+        with executor.lane(LANE_PARSE):
+            future = session.post(...)
+    """
+    def __init__(self, max_workers):
+        self._max_workers = max_workers
+        self._queues = dict((lane, deque()) for lane in LANE_NAMES)
+        self._stats = dict((lane, LaneStats()) for lane in LANE_NAMES)
+        self._condition = threading.Condition()
+        self._threads = []
+        self._shutdown = False
+        self._submitting_lane = threading.local()
+
+    @contextmanager
+    def lane(self, lane):
+        """ Submit the work of the calling thread in the given lane while the
+        context is active.
+        """
+        previous = getattr(self._submitting_lane, "value", LANE_INTERACTIVE)
+        self._submitting_lane.value = lane
+        try:
+            yield
+        finally:
+            self._submitting_lane.value = previous
+
+    def submit(self, fn, *args, **kwargs):
+        lane = getattr(self._submitting_lane, "value", LANE_INTERACTIVE)
+        future = Future()
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            self._queues[lane].append(_WorkItem(future, fn, args, kwargs))
+            self._stats[lane].submitted += 1
+            self._condition.notify()
+            if len(self._threads) < self._max_workers:
+                self._start_worker()
+        return future
+
+    def shutdown(self, wait=True):
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def lane_stats(self):
+        """ Returns a readable line per lane with its current queue depth and
+        how long work items waited in it.
+        """
+        lines = []
+        with self._condition:
+            for lane in sorted(LANE_NAMES):
+                stats = self._stats[lane]
+                lines.append("{0}: {1} queued, {2} submitted, wait avg {3:.1f} "
+                             "ms max {4:.1f} ms".format(
+                                 LANE_NAMES[lane], len(self._queues[lane]),
+                                 stats.submitted,
+                                 stats.average_wait() * 1000,
+                                 stats.max_wait * 1000))
+        return lines
+
+    def _start_worker(self):
+        thread = threading.Thread(target=self._worker)
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+
+    def _next_work_item(self):
+        """ Blocks until there is work, returns None on shutdown """
+        with self._condition:
+            while True:
+                for lane in sorted(self._queues):
+                    queue = self._queues[lane]
+                    if queue:
+                        work_item = queue.popleft()
+                        wait = time.monotonic() - work_item.enqueue_time
+                        stats = self._stats[lane]
+                        stats.started += 1
+                        stats.total_wait += wait
+                        stats.max_wait = max(stats.max_wait, wait)
+                        return work_item
+                if self._shutdown:
+                    return None
+                self._condition.wait()
+
+    def _worker(self):
+        while True:
+            work_item = self._next_work_item()
+            if work_item is None:
+                return
+            if work_item.future.set_running_or_notify_cancel():
+                work_item.run()
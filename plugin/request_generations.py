@@ -0,0 +1,79 @@
+# Copyright (C) 2014 Ivan Koster
+# 
+# This file is part of SublimeYouCompleteMe.
+# 
+# SublimeYouCompleteMe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# SublimeYouCompleteMe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with SublimeYouCompleteMe.  If not, see <http://www.gnu.org/licenses/>.
+
+""" See the RequestGenerations class """
+import threading
+
+
+class RequestGenerations(object):
+    """ Numbers the requests of one kind (e.g. completions) per buffer, so a
+    newer request supersedes the older ones.
+
+    A superseded request is cancelled when it is still waiting in the request
+    queue. When it is already running its result should be discarded, which
+    the response handler does by checking is_current().
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generations = {} # (kind, buffer_id) -> generation
+        self._futures = {} # (kind, buffer_id) -> future of that generation
+        self.cancelled = 0
+        self.discarded = 0
+
+    def begin(self, kind, buffer_id):
+        """ Start a new generation of requests of kind for the buffer and
+        cancel the future of the previous one. Returns the new generation.
+        """
+        key = (kind, buffer_id)
+        with self._lock:
+            generation = self._generations.get(key, 0) + 1
+            self._generations[key] = generation
+            previous = self._futures.pop(key, None)
+        if previous and previous.cancel():
+            self.cancelled += 1
+        return generation
+
+    def track(self, kind, buffer_id, generation, future):
+        """ Remember the future of a generation, so it can be cancelled when
+        it is superseded.
+        """
+        key = (kind, buffer_id)
+        with self._lock:
+            if self._generations.get(key, 0) == generation:
+                self._futures[key] = future
+                return
+        # Superseded before it was even tracked
+        if future.cancel():
+            self.cancelled += 1
+
+    def is_current(self, kind, buffer_id, generation):
+        """ Is this still the newest generation? Counts a discarded result
+        if it isn't.
+        """
+        with self._lock:
+            current = self._generations.get((kind, buffer_id), 0) == generation
+            if not current:
+                self.discarded += 1
+        return current
+
+    def forget_buffer(self, buffer_id):
+        """ Drop all generations of a buffer """
+        with self._lock:
+            for key in list(self._generations):
+                if key[1] == buffer_id:
+                    del self._generations[key]
+                    self._futures.pop(key, None)
@@ -16,12 +16,20 @@
 # along with SublimeYouCompleteMe.  If not, see <http://www.gnu.org/licenses/>.
 
 """ This module contains functions to perform actions in sublime text """
-from collections import deque, defaultdict
+from collections import deque
+import os
 
 import sublime
 
+from SublimeYouCompleteMe.plugin.diagnostics_index import Diagnostic, \
+     DiagnosticIndex
+
 GOTO_HISTORY = deque([], 50)
-DIAGNOSTICS_STORE = defaultdict(dict)
+DIAGNOSTICS_STORE = {} # view.id() -> DiagnosticIndex
+# view.id() -> {region key: tuple of (a, b) of the regions shown with it}
+SHOWN_DIAGNOSTIC_REGIONS = {}
+# Diagnostics of these kinds are drawn before the other kinds
+URGENT_DIAGNOSTIC_KINDS = ("ERROR",)
 
 
 def jump_to_location(view, target_file, target_line, target_column):
@@ -48,56 +56,155 @@ def jump_back(view):
 
 
 def show_ycmd_diagnostics(view, diagnostics):
-    """ Shows the diagnostics for the file in the given view"""
-    view.erase_regions("ycm.diags")
-    view.hide_popup()
+    """ Shows the diagnostics for the file in the given view.
+    The regions are drawn with a region key per kind of diagnostic, and only
+    the keys whose regions differ from what the view shows are redrawn.
+    Errors are drawn right away, the other kinds each in a later call from
+    the main loop, so a long list of warnings doesn't block the UI.
+    Each diagnostic remembers which drawn region is its own, sublime moves
+    these regions along with edits, see get_diagnostic_index().
+    """
     global DIAGNOSTICS_STORE
-    try:
-        del DIAGNOSTICS_STORE[view.id()]
-    except KeyError:
-        pass
+    words = []
+    positions_by_key = {}
 
-    if not diagnostics:
-        return
-    regions = []
-
-    for diag in diagnostics:
+    for diag in diagnostics or []:
         if diag["location"]["filepath"] == view.file_name():
             line_num = diag["location"]["line_num"]
             col_num = diag["location"]["column_num"]
             point = view.text_point(line_num-1, col_num-1)
             word = view.word(point+1)
-            regions.append(word)
+            key = _diagnostic_region_key(diag["kind"])
+            words.append((key, word, diag))
+            positions_by_key.setdefault(key, set()).add((word.begin(),
+                                                         word.end()))
+
+    # One region per word and key, sorted so the order of the regions sublime
+    # returns later matches the order they were drawn in
+    regions_by_key = {}
+    region_indexes = {}
+    for key, positions in positions_by_key.items():
+        positions = sorted(positions)
+        regions_by_key[key] = [sublime.Region(a, b) for a, b in positions]
+        region_indexes[key] = dict((position, index)
+                                   for index, position in enumerate(positions))
+
+    view_diagnostics = []
+    for key, word, diag in words:
+        view_diagnostics.append(Diagnostic(
+            word.begin(), word.end(), diag["kind"], diag["text"], key,
+            region_indexes[key][(word.begin(), word.end())]))
+
+    if view_diagnostics:
+        DIAGNOSTICS_STORE[view.id()] = DiagnosticIndex(view_diagnostics,
+                                                       view.change_count())
+    else:
+        DIAGNOSTICS_STORE.pop(view.id(), None)
+
+    shown = SHOWN_DIAGNOSTIC_REGIONS.setdefault(view.id(), {})
+    changed_keys = []
+    for key in set(shown) | set(regions_by_key):
+        regions = regions_by_key.get(key, [])
+        new_shown = tuple((region.a, region.b) for region in regions)
+        if shown.get(key, ()) != new_shown:
+            changed_keys.append(key)
+            shown[key] = new_shown
+    if not changed_keys:
+        return
+
+    view.hide_popup()
+    urgent_keys = [_diagnostic_region_key(kind)
+                   for kind in URGENT_DIAGNOSTIC_KINDS]
+    for key in sorted(changed_keys, key=lambda key: key not in urgent_keys):
+        regions = regions_by_key.get(key, [])
+        if key in urgent_keys:
+            _draw_diagnostic_regions(view, key, regions)
+        else:
+            sublime.set_timeout(lambda key=key, regions=regions:
+                                _draw_diagnostic_regions(view, key, regions),
+                                0)
+
+
+def get_diagnostic_index(view):
+    """ The DiagnosticIndex of the view, or None.
+    When the buffer was edited since the diagnostics were shown, their
+    positions are taken from the regions sublime moved along with the edits,
+    so they stay right until YCMD reparses the file.
+    """
+    index = DIAGNOSTICS_STORE.get(view.id(), None)
+    if not index or index.change_count == view.change_count():
+        return index
+
+    shown = SHOWN_DIAGNOSTIC_REGIONS.get(view.id(), {})
+    regions_by_key = {}
+    for key in set(diag.region_key for diag in index):
+        regions = view.get_regions(key)
+        # Not drawn yet or changed in an unexpected way, keep the positions
+        if len(regions) == len(shown.get(key, ())):
+            regions_by_key[key] = regions
+            shown[key] = tuple((region.a, region.b) for region in regions)
 
-            DIAGNOSTICS_STORE[view.id()][(word.a, word.b)] = \
-                "{0}: {1}".format(diag["kind"], diag["text"])
+    for diag in index:
+        regions = regions_by_key.get(diag.region_key, None)
+        if regions:
+            region = regions[diag.region_index]
+            diag.begin = region.begin()
+            diag.end = region.end()
 
+    index = DiagnosticIndex(index, view.change_count())
+    DIAGNOSTICS_STORE[view.id()] = index
+    return index
+
+
+def _diagnostic_region_key(kind):
+    return "ycm.diags.{0}".format(kind.lower())
+
+
+def _draw_diagnostic_regions(view, key, regions):
+    # add_regions replaces the regions of the key in one go, erasing them
+    # first would make them flicker
     if regions:
-        view.add_regions("ycm.diags", regions, "invalid", "dot")
+        view.add_regions(key, regions, "invalid", "dot")
+    else:
+        view.erase_regions(key)
 
 
 def update_statusbar(view):
     """ Shows diagnostics text in status bar of the selected diagnostic. """
     view.erase_status("ycm-diags")
-    diags = DIAGNOSTICS_STORE.get(view.id(), None)
+    diags = get_diagnostic_index(view)
     if not diags:
         return
     cursor_position = view.sel()[0].begin()
-    line, column = view.rowcol(cursor_position)
-    word = view.word(view.text_point(line, column))
+    found = diags.at(cursor_position)
     # Sometimes a diagnostic text appears at the end of a line and is reported 
-    # on the next line. word2 is a second attempt to to select it.
-    word2 = view.word(view.text_point(line, column+1))
-    word2_spans_multi_lines = len(view.lines(word2)) == 2
-
-    text = diags.get((word.a, word.b), None)
-    if not text and word2_spans_multi_lines:
-        text = diags.get((word2.a, word2.b), None)
-    if text:
+    # on the next line. Look at the start of the next line as well.
+    if not found and view.line(cursor_position).end() == cursor_position:
+        found = diags.at(cursor_position + 1)
+    if found:
+        text = "\n".join(diag.message for diag in found)
         view.set_status("ycm-diags", text)
         view.show_popup(text, sublime.COOPERATE_WITH_AUTO_COMPLETE)
 
 
+def jump_to_diagnostic(view, forward=True):
+    """ Move the cursor to the next or previous diagnostic in the view,
+    wrapping around at the end of the file.
+    """
+    diags = get_diagnostic_index(view)
+    if not diags:
+        return
+    cursor_position = view.sel()[0].begin()
+    if forward:
+        diag = diags.next_after(cursor_position) or diags.first()
+    else:
+        diag = diags.previous_before(cursor_position) or diags.last()
+    view.sel().clear()
+    view.sel().add(sublime.Region(diag.begin))
+    view.show(diag.begin)
+    update_statusbar(view)
+
+
 def clear_view_from_diagnostics_store(view):
     """ Remove a view from the diagnostics store """
     global DIAGNOSTICS_STORE
@@ -105,6 +212,7 @@ def clear_view_from_diagnostics_store(view):
         del DIAGNOSTICS_STORE[view.id()]
     except KeyError:
         pass
+    SHOWN_DIAGNOSTIC_REGIONS.pop(view.id(), None)
 
 
 def find_view_by_buffer_id(buffer_id):
@@ -114,6 +222,47 @@ def find_view_by_buffer_id(buffer_id):
             if view.buffer_id() == buffer_id:
                 return view
 
+def buffer_has_other_views(view):
+    """ Returns True if another view than the given one shows its buffer """
+    for window in sublime.windows():
+        for other_view in window.views():
+            if other_view.buffer_id() == view.buffer_id() and \
+               other_view.id() != view.id():
+                return True
+    return False
+
+def project_key_of_file(file_path):
+    """ The project a file belongs to: the project file of the window that
+    shows it, or the window itself when it has no project file. Files that
+    aren't open belong to the window that has a folder containing them, or
+    to the "" project when there is none.
+    """
+    normalized_path = os.path.normcase(os.path.abspath(file_path))
+    containing_window = None
+    for window in sublime.windows():
+        if window.find_open_file(file_path):
+            return _project_key_of_window(window)
+        if containing_window is None:
+            for folder in window.folders():
+                folder = os.path.normcase(os.path.abspath(folder))
+                if normalized_path.startswith(folder.rstrip(os.sep) + os.sep):
+                    containing_window = window
+                    break
+    if containing_window is None:
+        return ""
+    return _project_key_of_window(containing_window)
+
+def _project_key_of_window(window):
+    return window.project_file_name() or "window:{0}".format(window.id())
+
+def get_ycmd_filetype(view, point=None):
+    """ The filetype YCMD knows for the view, based on the scope at the given
+    point or at the first cursor.
+    """
+    if point is None:
+        point = view.sel()[0].begin()
+    return map_filetype_sublime_to_ycmd(view.scope_name(point).split()[0][7:])
+
 def map_filetype_sublime_to_ycmd(filetype):
     """ Maps a filetype that sublime reports (scope name) to a filetype that
     YCMD knows. """
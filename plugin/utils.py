@@ -16,14 +16,12 @@
 # along with SublimeYouCompleteMe.  If not, see <http://www.gnu.org/licenses/>.
 
 """ A collection of handy helper functions """
-import collections
-import json
 import sys
 import os
 import socket
 from threading import Thread, Event
 
-from . import settings
+from . import settings, ycmd_json
 
 WIN_PYTHON27_PATH = "C:\\python27\\python.exe" #TODO pythonw
 
@@ -42,26 +40,9 @@ def to_utf8_if_needed(obj):
         return obj
     return str(obj)
 
-def encode_unicode_to_utf8(data):
-    """ Encode data to utf8. Also recurses into iterables and dicts and converts
-    those contents also to utf8
-    """
-    if isinstance(data, bytes):
-        return data.encode("utf-8")
-    if isinstance(data, str):
-        return data
-    elif isinstance(data, collections.Mapping):
-        return dict(map(encode_unicode_to_utf8, data.items()))
-    elif isinstance(data, collections.Iterable):
-        return type(data)(map(encode_unicode_to_utf8, data))
-    else:
-        return data
-
-
 def to_utf8_json(data):
-    """ Converts data to utf8 recursively and then converts it to json """
-    return json.dumps(encode_unicode_to_utf8(data),
-                      ensure_ascii=False)
+    """ Converts data to json in a single pass, see the ycmd_json module """
+    return ycmd_json.dumps(data)
 
 def on_windows():
     """ Are we on windows? """
@@ -0,0 +1,195 @@
+# Copyright (C) 2014 Ivan Koster
+# 
+# This file is part of SublimeYouCompleteMe.
+# 
+# SublimeYouCompleteMe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# SublimeYouCompleteMe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with SublimeYouCompleteMe.  If not, see <http://www.gnu.org/licenses/>.
+
+""" The HMAC that authenticates the requests to and responses from YCMD.
+
+YCMD expects the base64 encoded hex digest of a HMAC-SHA256 of the request
+body in the x-ycm-hmac header, and signs its responses the same way. The
+request body is signed as the exact bytes that are sent, so it is serialized
+and encoded only once per request. A response body is hashed chunk by chunk
+while it is read, so checking it doesn't need a second pass over the body.
+
+Run this module with python to see the time and peak memory of building a
+signed request body compared to signing a string body, and the overhead of
+verifying responses of several sizes.
+"""
+import base64
+import hashlib
+import hmac
+
+HMAC_HEADER = "x-ycm-hmac"
+RESPONSE_CHUNK_SIZE = 64 * 1024
+
+
+class InvalidHmacError(RuntimeError):
+    """ The HMAC of a response from YCMD didn't match its body """
+    pass
+
+
+def create_hmac(body, secret):
+    """ The value of the HMAC header for a request body of bytes """
+    digest = hmac.new(secret, msg=body, digestmod=hashlib.sha256).hexdigest()
+    return base64.b64encode(digest.encode("utf-8"))
+
+
+class HmacVerifier(object):
+    """ Hashes a body as it is read and checks it against the HMAC header
+    in constant time.
+    """
+    def __init__(self, secret):
+        self._hmac = hmac.new(secret, digestmod=hashlib.sha256)
+
+    def update(self, chunk):
+        """ Add the next chunk of the body """
+        self._hmac.update(chunk)
+
+    def verify(self, header_value):
+        """ Does the header value match the body hashed so far? """
+        if not header_value:
+            return False
+        if not isinstance(header_value, bytes):
+            header_value = header_value.encode("utf-8")
+        expected = base64.b64encode(self._hmac.hexdigest().encode("utf-8"))
+        return hmac.compare_digest(expected, header_value)
+
+
+def verify_chunks(chunks, header_value, secret, consume):
+    """ Pass all chunks of a response body to consume as they arrive, hashing
+    them on the way. Raises InvalidHmacError after the last chunk when the
+    HMAC header doesn't match, so whatever consume built must not be used
+    before this returns.
+    """
+    verifier = HmacVerifier(secret)
+    for chunk in chunks:
+        verifier.update(chunk)
+        consume(chunk)
+    if not verifier.verify(header_value):
+        raise InvalidHmacError("Received invalid HMAC for response!")
+
+
+def read_verified_chunks(chunks, header_value, secret):
+    """ Read all chunks of a response body, hashing them as they arrive.
+    Returns the list of chunks, or raises InvalidHmacError when the HMAC
+    header doesn't match.
+    """
+    received = []
+    verify_chunks(chunks, header_value, secret, received.append)
+    return received
+
+
+def read_verified_body(response, secret):
+    """ Read the body of a streamed requests-response and check it against
+    its HMAC header. Returns the body as bytes.
+    """
+    return b"".join(read_verified_chunks(
+        response.iter_content(RESPONSE_CHUNK_SIZE),
+        response.headers.get(HMAC_HEADER, None), secret))
+
+
+def decode_verified_body(response, secret, decoder):
+    """ Feed the body of a streamed requests-response to a decoder while it
+    is read, and check it against its HMAC header. The decoder needs a
+    feed(chunk) and a close() method, returns what close() returns.
+    """
+    verify_chunks(response.iter_content(RESPONSE_CHUNK_SIZE),
+                  response.headers.get(HMAC_HEADER, None), secret,
+                  decoder.feed)
+    return decoder.close()
+
+
+def benchmark(file_size=8 * 1024 * 1024):
+    """ Compare the old request path, which signed an encoded copy of the JSON
+    string and let the HTTP layer encode it again, with the path requests
+    take now: one bytes body from ycmd_json.dumps_bytes that is signed and
+    sent.
+    """
+    import json
+    import os
+    import time
+    import tracemalloc
+    try:
+        from SublimeYouCompleteMe.plugin import ycmd_json
+    except ImportError:
+        import ycmd_json # run as a script from the plugin directory
+
+    secret = os.urandom(16)
+    line = "    std::vector<int> values = compute(\"r\\u00e9sultat\", 42);\n"
+    request = {"filepath": "/src/generated.h",
+               "file_data": {"/src/generated.h": {
+                   "filetypes": ["cpp"],
+                   "contents": line * (file_size // len(line))}}}
+
+    def old_path():
+        body = json.dumps(request, ensure_ascii=False)
+        header = create_hmac(body.encode("utf-8"), secret)
+        sent = body.encode("utf-8") # what the HTTP layer did with the str
+        return header, sent
+
+    def new_path():
+        # As in YCMDRequest._talk_to_handler_async
+        body = ycmd_json.dumps_bytes(request)
+        return create_hmac(body, secret), body
+
+    for name, function in [("old", old_path), ("bytes", new_path)]:
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("{0:6} {1:7.1f} ms peak {2:6.1f} MB".format(
+            name, elapsed * 1000, peak / 1024.0 / 1024.0))
+
+
+def benchmark_response_verification(rounds=20):
+    """ Time reading response bodies of several sizes in chunks, with and
+    without verifying their HMAC.
+    """
+    import io
+    import os
+    import time
+
+    secret = os.urandom(16)
+    for size in [1024, 64 * 1024, 1024 * 1024, 16 * 1024 * 1024]:
+        body = os.urandom(size)
+        header = create_hmac(body, secret)
+
+        def chunks():
+            stream = io.BytesIO(body)
+            return iter(lambda: stream.read(RESPONSE_CHUNK_SIZE), b"")
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            b"".join(list(chunks()))
+        plain = (time.perf_counter() - start) / rounds
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            b"".join(read_verified_chunks(chunks(), header, secret))
+        verified = (time.perf_counter() - start) / rounds
+
+        print("{0:9} bytes: read {1:8.3f} ms, read and verify {2:8.3f} ms "
+              "({3:.0f} MB/s hashing)".format(
+                  size, plain * 1000, verified * 1000,
+                  size / max(verified - plain, 1e-9) / 1024.0 / 1024.0))
+
+
+if __name__ == "__main__":
+    benchmark()
+    benchmark_response_verification()
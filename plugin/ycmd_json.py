@@ -0,0 +1,111 @@
+# Copyright (C) 2014 Ivan Koster
+# 
+# This file is part of SublimeYouCompleteMe.
+# 
+# SublimeYouCompleteMe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# SublimeYouCompleteMe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with SublimeYouCompleteMe.  If not, see <http://www.gnu.org/licenses/>.
+
+""" JSON serialization of the requests for the YCMD server.
+
+The request data is serialized in a single pass, strings are already unicode
+in python 3 so they don't have to be converted first. When ujson is
+available it is used, otherwise the encoder of the standard library.
+
+Run this module with python to benchmark it against the old approach of
+rebuilding the request data before serializing it.
+"""
+import json
+
+try:
+    import ujson as _fast_json
+except ImportError:
+    _fast_json = None
+
+
+def _decode_bytes(obj):
+    if isinstance(obj, bytes):
+        return obj.decode("utf-8")
+    raise TypeError("{0!r} is not JSON serializable".format(obj))
+
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"),
+                            default=_decode_bytes)
+
+
+def dumps(data):
+    """ Serialize request data to a JSON string """
+    if _fast_json:
+        return _fast_json.dumps(data, ensure_ascii=False)
+    return _ENCODER.encode(data)
+
+
+def dumps_bytes(data):
+    """ Serialize request data to utf-8 encoded JSON, ready to be signed and
+    sent.
+    """
+    return dumps(data).encode("utf-8")
+
+
+def backend_name():
+    """ The name of the JSON library that is used """
+    return "ujson" if _fast_json else "json"
+
+
+def benchmark(file_size=8 * 1024 * 1024, rounds=5):
+    """ Compare serializing a request with a large buffer the old way and
+    with dumps(), printing the time and peak memory of both.
+    """
+    import collections
+    import time
+    import tracemalloc
+
+    def old_encode_unicode_to_utf8(data):
+        if isinstance(data, str):
+            return data
+        elif isinstance(data, collections.abc.Mapping):
+            return dict(map(old_encode_unicode_to_utf8, data.items()))
+        elif isinstance(data, collections.abc.Iterable):
+            return type(data)(map(old_encode_unicode_to_utf8, data))
+        else:
+            return data
+
+    def old_to_utf8_json(data):
+        return json.dumps(old_encode_unicode_to_utf8(data), ensure_ascii=False)
+
+    line = "    std::vector<int> values = compute(\"r\\u00e9sultat\", 42);\n"
+    contents = line * (file_size // len(line))
+    request = {"line_num": 120, "column_num": 17,
+               "filepath": "/home/user/project/src/generated.h",
+               "event_name": "FileReadyToParse",
+               "file_data": {"/home/user/project/src/generated.h":
+                             {"filetypes": ["cpp"], "contents": contents}}}
+
+    print("{0:.1f} MB buffer, {1} backend".format(
+        len(contents) / 1024.0 / 1024.0, backend_name()))
+    for name, function in [("old", old_to_utf8_json), ("dumps", dumps)]:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            function(request)
+        elapsed = (time.perf_counter() - start) / rounds
+
+        tracemalloc.start()
+        function(request)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("{0:6} {1:7.1f} ms {2:8.1f} MB/s peak {3:6.1f} MB".format(
+            name, elapsed * 1000, len(contents) / elapsed / 1024.0 / 1024.0,
+            peak / 1024.0 / 1024.0))
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -24,8 +24,9 @@ class YCMDKeepAlive(threading.Thread):
     """ Keep the YCMD server alive by pinging it with a message every once in
     a while.
     """
-    def __init__(self, ping_interval_seconds=60):
+    def __init__(self, server, ping_interval_seconds=60):
         super(YCMDKeepAlive, self).__init__()
+        self._server = server
         self._ping_interval_seconds = ping_interval_seconds
         self._stop_event = threading.Event()
         self.daemon = True
@@ -35,7 +36,8 @@ class YCMDKeepAlive(threading.Thread):
         print("Started YCMD keepalive thread")
         while not self._stop_event.is_set():
             try:
-                print(YCMDRequest.get_data_from_handler("healthy"))
+                print(YCMDRequest.get_data_from_handler("healthy",
+                                                        self._server))
             except:
                 pass # If the server is down / can't be reached we do nothing
 
@@ -16,23 +16,29 @@
 # along with SublimeYouCompleteMe.  If not, see <http://www.gnu.org/licenses/>.
 
 """ See the YCMDRequest class """
-import urllib.parse
-import base64
-import hmac
-import hashlib
+import json
+from concurrent.futures import Future
 
 import requests
-from requests_futures.sessions import FuturesSession
 import sublime
-from ycmd import responses
-
-from SublimeYouCompleteMe.plugin import utils, sublime_support
+from ycmd import responses, user_options_store
+
+from SublimeYouCompleteMe.plugin import utils, sublime_support, buffer_sync, \
+     settings, ycmd_transport, priority_executor, ycmd_json, ycmd_hmac
+from SublimeYouCompleteMe.plugin.completion_cache import CompletionCache, \
+     CompletionQuery, DEFAULT_MIN_QUERY_LENGTH
+from SublimeYouCompleteMe.plugin.diagnostics_cache import DiagnosticsCache, \
+     DEFAULT_MAX_KB
+from SublimeYouCompleteMe.plugin.request_generations import RequestGenerations
+from SublimeYouCompleteMe.plugin.ycmd_stream import CompletionsStreamDecoder, \
+     DEFAULT_MAX_CANDIDATES, DEFAULT_MAX_SHOWN
 
 class YCMDRequest(object):
-    """ Wrapper class to send requests to the YCMD server. 
-    This wrapper is supposed to work with only one server and you'll have to 
-    set the server_base_URI and shared_hmac_secret after you've started the 
-    server process.
+    """ Wrapper class to send requests to the YCMD servers. 
+    A request goes to the server that server_pool returns for the file of the
+    request, unless a server is given. A server has a base_uri, hmac_secret,
+    startup (a ServerStartup) and extra_conf_decisions. The first request to
+    a server starts it and requests are held until it is ready.
 
     The YCMD server has several handlers that are accessed by their URI.
     For example:
@@ -42,91 +48,176 @@ class YCMDRequest(object):
     methods.
     """
 
-    server_base_URI = ""
-    shared_hmac_secret = ""
-    session = FuturesSession(max_workers=30)
+    # The priority lane of requests to each POST handler. GET requests are
+    # health checks and go in the background lane.
+    handler_lanes = {"completions": priority_executor.LANE_INTERACTIVE,
+                     "run_completer_command":
+                        priority_executor.LANE_INTERACTIVE,
+                     "load_extra_conf_file": priority_executor.LANE_INTERACTIVE,
+                     "ignore_extra_conf_file":
+                        priority_executor.LANE_INTERACTIVE,
+                     "event_notification": priority_executor.LANE_PARSE}
+
+    server_pool = None
+    generations = RequestGenerations()
+    session = None # made by start_session
 
     def __init__(self):
         pass
 
     @staticmethod
-    def get_data_from_handler(handler):
-        """ GET data from the YCMD server """
+    def start_session():
+        """ Make the session with as many workers as the request_workers
+        setting. Call it from plugin_loaded, the settings aren't loaded
+        before. A reloaded plugin keeps using the session it made before.
+        """
+        if YCMDRequest.session is None:
+            YCMDRequest.session = ycmd_transport.create_session(
+                settings.SETTINGS.get("request_workers",
+                                      ycmd_transport.DEFAULT_MAX_WORKERS))
+
+    @staticmethod
+    def server_for_file(file_path):
+        """ The YCMD server that handles the file """
+        return YCMDRequest.server_pool.server_for_file(file_path)
+
+    @staticmethod
+    def get_data_from_handler(handler, server):
+        """ GET data from a YCMD server """
         return YCMDRequest.json_from_future(\
-                    YCMDRequest._talk_to_handler_async("", handler, "GET"))
+                    YCMDRequest._talk_to_handler_async("", handler, "GET",
+                                                       server=server))
 
     @staticmethod
-    def post_data_to_handler(data, handler):
+    def probe_handler(handler, server):
+        """ GET data from a YCMD server without waiting for its startup, to
+        find out whether it is ready.
+        """
+        return YCMDRequest.json_from_future(\
+                    YCMDRequest._talk_to_handler_async(
+                        "", handler, "GET", wait_for_server=False,
+                        server=server))
+
+    @staticmethod
+    def post_data_to_handler(data, handler, stream_decoder=None,
+                             wait_for_server=True, server=None):
         """ POST data to the YCMD server """
         return YCMDRequest.json_from_future(\
-                    YCMDRequest._talk_to_handler_async(data, handler, "POST"))
+                    YCMDRequest._talk_to_handler_async(
+                        data, handler, "POST", stream_decoder=stream_decoder,
+                        wait_for_server=wait_for_server, server=server))
 
     @staticmethod
-    def post_data_to_handler_async(data, handler, finished_cb=None):
+    def post_data_to_handler_async(data, handler, finished_cb=None,
+                                   stream_decoder=None):
         """ POST data to the YCMD server. Returns a requests-future.
         Optionally provide a callback that is called when the future completes.
+        A stream decoder decodes a successful response while it is received,
+        json_from_response then returns what the decoder returned.
         """
         return YCMDRequest._talk_to_handler_async(data, handler, "POST",
-                                                  finished_cb)
+                                                  finished_cb, stream_decoder)
 
     @staticmethod
-    def _talk_to_handler_async(data, handler, http_method, finished_cb=None):
+    def _talk_to_handler_async(data, handler, http_method, finished_cb=None,
+                               stream_decoder=None, wait_for_server=True,
+                               server=None):
         """ Internal method that actually communicates with the YCMD server in
-        async fashion.
+        async fashion. Without a server, the request goes to the server of the
+        filepath in the data.
         Returns a requests-future.
         """
+        if server is None:
+            server = YCMDRequest.server_for_file(data.get("filepath", None))
+
+        def on_response(session, response):
+            # The body is streamed and its HMAC checked while it is read, in
+            # the worker thread. Errors are raised by json_from_response.
+            try:
+                YCMDRequest._read_verified_body(response, server.hmac_secret,
+                                                stream_decoder)
+            except Exception:
+                pass
+            if finished_cb:
+                finished_cb(session, response)
+
+        executor = YCMDRequest.session.executor
         if http_method == "POST":
-            json_data = utils.to_utf8_json(data)
-            return YCMDRequest.session.post(YCMDRequest._build_uri(handler),
-                                            data=json_data,
-                                            headers=YCMDRequest.\
-                                            _generate_http_headers(json_data),
-                                            timeout=30,
-                                            background_callback=finished_cb)
-        if http_method == "GET":
-            return YCMDRequest.session.get(YCMDRequest._build_uri(handler),
-                                           headers=YCMDRequest.\
-                                           _generate_http_headers(),
-                                           timeout=30,
-                                           background_callback=finished_cb)
+            # Serialized and encoded once, the same bytes are signed and sent
+            json_data = ycmd_json.dumps_bytes(data)
+            buffer_sync.record_request(data.get("filepath", None),
+                                       len(json_data))
+            lane = YCMDRequest.handler_lanes.get(
+                handler, priority_executor.LANE_INTERACTIVE)
+
+            def send():
+                with executor.lane(lane):
+                    return YCMDRequest.session.post(
+                        YCMDRequest._build_uri(server, handler),
+                        data=json_data,
+                        headers=YCMDRequest._generate_http_headers(
+                            server, json_data),
+                        timeout=30,
+                        stream=True,
+                        background_callback=on_response)
+        elif http_method == "GET":
+            def send():
+                with executor.lane(priority_executor.LANE_BACKGROUND):
+                    return YCMDRequest.session.get(
+                        YCMDRequest._build_uri(server, handler),
+                        headers=YCMDRequest._generate_http_headers(server),
+                        timeout=30,
+                        stream=True,
+                        background_callback=on_response)
+        else:
+            return None
+
+        # The URI and HMAC secret are only known once the server is started
+        if wait_for_server:
+            return server.startup.run_when_ready(send)
+        return send()
 
     @staticmethod
-    def _generate_http_headers(request_body=""):
-        """ Generate a dict of HTTP headers the YCMD server wants. """
-        digest = hmac.new(YCMDRequest.shared_hmac_secret,
-                          msg=request_body.encode("utf-8"),
-                          digestmod=hashlib.sha256).hexdigest()
-        _hmac = base64.b64encode(digest.encode("utf-8"))
+    def _generate_http_headers(server, request_body=b""):
+        """ Generate a dict of HTTP headers the YCMD server wants. The request
+        body must be the bytes that are sent.
+        """
+        _hmac = ycmd_hmac.create_hmac(request_body, server.hmac_secret)
         headers = {"content-type": "application/json",
-                   "x-ycm-hmac": _hmac}
+                   ycmd_hmac.HMAC_HEADER: _hmac}
         return headers
 
     @staticmethod
-    def _build_uri(handler):
+    def _build_uri(server, handler):
         """ Build an URI for a handler on the YCMD server """
-        return urllib.parse.urljoin(YCMDRequest.server_base_URI, handler)
+        # urljoin doesn't know the http+unix scheme of unix socket URIs
+        return server.base_uri.rstrip("/") + "/" + handler
 
     @staticmethod
-    def build_request_data(include_buffer_data=True, view=None):
+    def build_request_data(include_buffer_data=True, view=None,
+                           max_num_candidates=None):
         """Build a dict with request data for the YCMD server"""
         if not view:
             view = sublime.active_window().active_view()
         cursor_position = view.sel()[0].begin()
         line, column = view.rowcol(cursor_position)
         file_path = view.file_name()
-        file_type = sublime_support.map_filetype_sublime_to_ycmd(
-                        view.scope_name(cursor_position).split()[0][7:])
+        file_type = sublime_support.get_ycmd_filetype(view, cursor_position)
 
-        file_contents = view.substr(sublime.Region(0, view.size()))
         request_data = {"line_num": line + 1,
                         "column_num": column + 1,
                         "filepath": file_path}
 
         if include_buffer_data:
+            file_contents = buffer_sync.snapshot(view).contents
             request_data["file_data"] = \
                 {file_path: {"filetypes": [file_type],
                              "contents": file_contents}}
 
+        if max_num_candidates:
+            # Lets YCMD stop ranking and serializing candidates early
+            request_data["max_num_candidates"] = max_num_candidates
+
         return request_data
 
     @staticmethod
@@ -140,16 +231,45 @@ class YCMDRequest(object):
         Throws exceptions if there are communication errors or the received
         HMAC is invalid
         """
-        # TODO: validate the hmac from the response
+        body = YCMDRequest._read_verified_body(response)
         if response.status_code == requests.codes.server_error:
-            YCMDRequest.raise_exception_for_json_data(response.json())
+            YCMDRequest.raise_exception_for_json_data(
+                json.loads(body.decode("utf-8")))
 
         response.raise_for_status()
 
-        if response.content:
-            return response.json()
+        if hasattr(response, "ycmd_json"):
+            return response.ycmd_json
+        if body:
+            return json.loads(body.decode("utf-8"))
         return None
 
+    @staticmethod
+    def _read_verified_body(response, hmac_secret=None, stream_decoder=None):
+        """ Read the body of a streamed response and check its HMAC with the
+        secret of the server that sent it. The body is only read once, later
+        calls return the same body or raise the same error.
+        A successful response is fed to the stream decoder instead, its
+        result is kept as ycmd_json and the returned body is empty.
+        """
+        if not hasattr(response, "ycmd_body"):
+            try:
+                if stream_decoder and response.status_code == requests.codes.ok:
+                    response.ycmd_json = ycmd_hmac.decode_verified_body(
+                        response, hmac_secret, stream_decoder)
+                    response.ycmd_body = b""
+                else:
+                    response.ycmd_body = ycmd_hmac.read_verified_body(
+                        response, hmac_secret)
+            except Exception as error:
+                response.ycmd_body = error
+                # The rest of the body isn't read, give the connection back
+                # to the pool by closing it
+                response.close()
+        if isinstance(response.ycmd_body, Exception):
+            raise response.ycmd_body
+        return response.ycmd_body
+
     @staticmethod
     def raise_exception_for_json_data(data):
         """ Raises the proper exception if the YCMD server sent an exception in
@@ -163,29 +283,96 @@ class YCMDRequest(object):
 
 
 class YCMDEventNotification(YCMDRequest):
-    """ Send event notifications to the YCMD server """
+    """ Send event notifications to the YCMD server.
+    The diagnostics of parses are cached per file and contents, so they can
+    be shown in a new view of the file before YCMD parsed it again.
+    """
+
+    # Sized by the diagnostics_cache_kb setting in configure_cache
+    diagnostics_cache = DiagnosticsCache(DEFAULT_MAX_KB * 1024)
+
     def __init__(self, event_name, sublime_view=None):
         super(YCMDEventNotification, self).__init__()
         self._event_name = event_name
-        if sublime_view:
-            self._sublime_buffer_id = sublime_view.buffer_id()
+        if not sublime_view:
+            sublime_view = sublime.active_window().active_view()
+        self._sublime_buffer_id = sublime_view.buffer_id()
+        self._file_path = sublime_view.file_name()
+
+        self._skipped = False
+        self._content_hash = buffer_sync.snapshot(sublime_view).content_hash
+        if self._event_name == "FileReadyToParse":
+            diagnostics = buffer_sync.diagnostics_of_parse(
+                self._sublime_buffer_id, self._content_hash)
+            if diagnostics is not None:
+                self._skip_parse(diagnostics)
+                return
 
         request_data = YCMDRequest.build_request_data(view=sublime_view)
         request_data["event_name"] = self._event_name
 
+        # A newer FileReadyToParse of the same buffer supersedes this one,
+        # we don't want to show diagnostics of an outdated snapshot.
+        generations = YCMDRequest.generations
+        generation = generations.begin(self._event_name,
+                                       self._sublime_buffer_id)
+
         def on_complete(session, response):
             if self._event_name != "FileReadyToParse":
                 return # These events have no response from YCMD
+            if not generations.is_current(self._event_name,
+                                          self._sublime_buffer_id, generation):
+                return
             sublime.set_timeout(lambda: self.handle_FileReadyToParse_response(\
-                                    response),
+                                    response, generation),
                                 0)
 
         self._future = YCMDRequest.post_data_to_handler_async(
                             request_data, "event_notification",
                             finished_cb=on_complete)
+        generations.track(self._event_name, self._sublime_buffer_id,
+                          generation, self._future)
+
+    @property
+    def future(self):
+        """ The requests-future of this notification """
+        return self._future
+
+    @property
+    def skipped(self):
+        """ True if YCMD already parsed these contents and the notification
+        wasn't sent.
+        """
+        return self._skipped
 
-    def handle_FileReadyToParse_response(self, response):
-        """ Display the diagnostics returned by YCMD. """
+    def _skip_parse(self, diagnostics):
+        """ Show the diagnostics of the previous parse of the same contents
+        instead of asking YCMD to parse them again. Newer parses of the
+        buffer still supersede this one.
+        """
+        self._skipped = True
+        generation = YCMDRequest.generations.begin(self._event_name,
+                                                   self._sublime_buffer_id)
+        self._future = Future()
+        self._future.set_result(None)
+
+        def show_diagnostics():
+            if not YCMDRequest.generations.is_current(
+                    self._event_name, self._sublime_buffer_id, generation):
+                return
+            view = sublime_support.find_view_by_buffer_id(
+                self._sublime_buffer_id)
+            if view:
+                sublime_support.show_ycmd_diagnostics(view, diagnostics)
+        sublime.set_timeout(show_diagnostics, 0)
+
+    def handle_FileReadyToParse_response(self, response, generation=None):
+        """ Display the diagnostics returned by YCMD, unless a newer parse of
+        the buffer was started since.
+        """
+        if generation is not None and not YCMDRequest.generations.is_current(
+                self._event_name, self._sublime_buffer_id, generation):
+            return
         view = sublime_support.find_view_by_buffer_id(self._sublime_buffer_id)
         if view:
             sublime_support.show_ycmd_diagnostics(view,
@@ -199,32 +386,81 @@ class YCMDEventNotification(YCMDRequest):
         handled here.
         """
         try:
-            return YCMDRequest.json_from_response(response)
+            diagnostics = YCMDRequest.json_from_response(response)
+            buffer_sync.record_parse(self._sublime_buffer_id,
+                                     self._content_hash, diagnostics)
+            YCMDEventNotification.diagnostics_cache.store(
+                self._file_path, self._content_hash, diagnostics)
+            return diagnostics
         except responses.UnknownExtraConf as error:
+            server = YCMDRequest.server_for_file(self._file_path)
             if sublime.ok_cancel_dialog("Do you want to load {0}?".format(
                     error.extra_conf_file)):
                 YCMDEventNotification.load_extra_conf_file(
-                    error.extra_conf_file) #This is a blocking call
+                    error.extra_conf_file, server) #This is a blocking call
                 # Parse the file again, because YCMD does not do it.
                 view = sublime_support.find_view_by_buffer_id(
                     self._sublime_buffer_id)
                 YCMDEventNotification("FileReadyToParse", sublime_view=view)
             else:
                 YCMDEventNotification.ignore_extra_conf_file(
-                    error.extra_conf_file)
+                    error.extra_conf_file, server)
             return []
 
     @staticmethod
-    def load_extra_conf_file(filepath):
-        """ Tell YCMD to load a given .ycm_extra_conf.py file """
+    def configure_cache():
+        """ Size the diagnostics cache by the diagnostics_cache_kb setting.
+        Call it from plugin_loaded, the settings aren't loaded before.
+        """
+        YCMDEventNotification.diagnostics_cache.resize(
+            settings.SETTINGS.get("diagnostics_cache_kb", DEFAULT_MAX_KB) *
+            1024)
+
+    @staticmethod
+    def show_cached_diagnostics(sublime_view):
+        """ Show the cached diagnostics of the file in the view, if it was
+        parsed with the same contents before. Returns True if they were shown.
+        """
+        diagnostics = YCMDEventNotification.diagnostics_cache.lookup(
+            sublime_view.file_name(),
+            buffer_sync.snapshot(sublime_view).content_hash)
+        if diagnostics is None:
+            return False
+        sublime_support.show_ycmd_diagnostics(sublime_view, diagnostics)
+        return True
+
+    @staticmethod
+    def load_extra_conf_file(filepath, server):
+        """ Tell a YCMD server to load a given .ycm_extra_conf.py file """
+        server.extra_conf_decisions[filepath] = True
         YCMDRequest.post_data_to_handler({"filepath": filepath},
-                                         "load_extra_conf_file")
+                                         "load_extra_conf_file", server=server)
 
     @staticmethod
-    def ignore_extra_conf_file(filepath):
-        """ Tell YCMD to ignore a given .ycm_extra_conf.py file """
+    def ignore_extra_conf_file(filepath, server):
+        """ Tell a YCMD server to ignore a given .ycm_extra_conf.py file """
+        server.extra_conf_decisions[filepath] = False
         YCMDRequest.post_data_to_handler({"filepath": filepath},
-                                         "ignore_extra_conf_file")
+                                         "ignore_extra_conf_file",
+                                         server=server)
+
+    @staticmethod
+    def replay_extra_conf_decisions(server):
+        """ Tell a restarted YCMD server which .ycm_extra_conf.py files the
+        user loaded or ignored before, so it doesn't ask again. The requests
+        don't wait for the startup, this is called while the server starts.
+        """
+        for filepath, load in list(server.extra_conf_decisions.items()):
+            handler = "load_extra_conf_file" if load \
+                      else "ignore_extra_conf_file"
+            try:
+                YCMDRequest.post_data_to_handler({"filepath": filepath},
+                                                 handler,
+                                                 wait_for_server=False,
+                                                 server=server)
+            except Exception as error:
+                print("YCMD could not {0} {1}: {2}".format(
+                    handler, filepath, error))
 
 
 class YCMDCommandRequest(YCMDRequest):
@@ -256,7 +492,14 @@ class YCMDCommandRequest(YCMDRequest):
 
 
 class YCMDCompletionRequest(YCMDRequest):
-    """ Send a request for completions to YCMD """
+    """ Send a request for completions to YCMD.
+    The candidates YCMD returns are cached, so typing more characters of the
+    same identifier can be answered without asking YCMD again.
+    """
+
+    cache = CompletionCache(user_options_store.DefaultOptions().get(
+        "min_num_of_chars_for_completion", DEFAULT_MIN_QUERY_LENGTH))
+
     def __init__(self):
         super(YCMDCompletionRequest, self).__init__()
 
@@ -266,23 +509,137 @@ class YCMDCompletionRequest(YCMDRequest):
         that sublime text understands.
         Sublime wants a tuple ("show text", "insert text") for each completion.
         """
-        request_data = YCMDRequest.build_request_data(view=sublime_view)
+        query = CompletionQuery.from_view(sublime_view)
+        if not force_semantic:
+            candidates = YCMDCompletionRequest.cache.lookup(
+                query, YCMDCompletionRequest._max_shown())
+            if candidates is not None:
+                return YCMDCompletionRequest.completions_from_candidates(
+                    candidates)
+        generation = YCMDCompletionRequest.cache.generation(query.buffer_id)
+        YCMDRequest.generations.begin("completions", query.buffer_id)
+
+        request_data = YCMDRequest.build_request_data(
+            view=sublime_view,
+            max_num_candidates=YCMDCompletionRequest._max_candidates())
         if force_semantic:
             request_data["force_semantic"] = True
+        decoder = YCMDCompletionRequest._create_stream_decoder()
         response = YCMDRequest.post_data_to_handler(request_data, 
-                                                    "completions")
+                                                    "completions",
+                                                    stream_decoder=decoder)
+        return YCMDCompletionRequest._handle_response(query, generation,
+                                                      response, decoder,
+                                                      force_semantic)
+
+    @staticmethod
+    def completions_from_cache(sublime_view):
+        """ Returns the completions for the view if the cache can answer them
+        without asking YCMD, otherwise None.
+        """
+        candidates = YCMDCompletionRequest.cache.lookup(
+            CompletionQuery.from_view(sublime_view),
+            YCMDCompletionRequest._max_shown())
+        if candidates is None:
+            return None
+        return YCMDCompletionRequest.completions_from_candidates(candidates)
+
+    @staticmethod
+    def send_async(sublime_view, finished_cb, force_semantic=False):
+        """ Send a request for completions to YCMD without waiting for the
+        answer. finished_cb is called from a background thread with the list
+        of sublime completions once YCMD has responded. It is not called if
+        the request failed or a newer completion request for the same buffer
+        was made, which also cancels this one if it is still queued.
+        Returns a requests-future.
+        """
+        query = CompletionQuery.from_view(sublime_view)
+        generation = YCMDCompletionRequest.cache.generation(query.buffer_id)
+        request_generation = YCMDRequest.generations.begin("completions",
+                                                           query.buffer_id)
+        request_data = YCMDRequest.build_request_data(
+            view=sublime_view,
+            max_num_candidates=YCMDCompletionRequest._max_candidates())
+        if force_semantic:
+            request_data["force_semantic"] = True
+        decoder = YCMDCompletionRequest._create_stream_decoder()
+
+        def on_complete(session, response):
+            if not YCMDRequest.generations.is_current(
+                    "completions", query.buffer_id, request_generation):
+                return
+            try:
+                completions = YCMDCompletionRequest._handle_response(
+                    query, generation, YCMDRequest.json_from_response(response),
+                    decoder, force_semantic)
+            except Exception as error:
+                print("YCMD completion request failed: {0}".format(error))
+                return
+            finished_cb(completions)
+
+        future = YCMDRequest.post_data_to_handler_async(request_data,
+                                                        "completions",
+                                                        finished_cb=on_complete,
+                                                        stream_decoder=decoder)
+        YCMDRequest.generations.track("completions", query.buffer_id,
+                                      request_generation, future)
+        return future
+
+    @staticmethod
+    def _max_candidates():
+        """ How many candidates to ask from YCMD and keep for refiltering """
+        return settings.SETTINGS.get("max_completion_candidates",
+                                     DEFAULT_MAX_CANDIDATES)
+
+    @staticmethod
+    def _max_shown():
+        """ How many completions to give to sublime at most """
+        return settings.SETTINGS.get("max_completions_shown",
+                                     DEFAULT_MAX_SHOWN)
+
+    @staticmethod
+    def _create_stream_decoder():
+        """ A decoder that converts the candidates of a completions response
+        to sublime completions while it is received. It keeps at most the
+        max_completion_candidates setting of them and only converts the
+        first max_completions_shown.
+        """
+        return CompletionsStreamDecoder(
+            YCMDCompletionRequest._max_candidates(),
+            convert=YCMDCompletionRequest.completion_from_candidate,
+            max_converted=YCMDCompletionRequest._max_shown())
+
+    @staticmethod
+    def _handle_response(query, generation, response, decoder,
+                         force_semantic=False):
+        """ Cache the candidates of a completions response and return them as
+        sublime completions, which the decoder already converted.
+        """
         if not response:
             return []
-        
-        sublime_completions = []
+        YCMDCompletionRequest.cache.store(
+            query, generation, response.get("completion_start_column", None),
+            response["completions"], complete=not decoder.truncated,
+            semantic=force_semantic)
+        return decoder.converted
+
+    @staticmethod
+    def completions_from_candidates(candidates):
+        """ Convert completion candidates from YCMD to a list of completions
+        that sublime text understands.
+        """
+        return [YCMDCompletionRequest.completion_from_candidate(comp)
+                for comp in candidates]
+
+    @staticmethod
+    def completion_from_candidate(comp):
+        """ Convert one completion candidate from YCMD to a completion tuple
+        that sublime text understands.
+        """
         f = utils.to_utf8_if_needed
-        for comp in response["completions"]:
-            if "extra_menu_info" in comp:
-                # We can show some extra info in the auto complete window
-                sublime_completions.append(\
-                    ("{0}\t{1}".format(f(comp['insertion_text']), 
-                                       f(comp['extra_menu_info'])),
-                     f(comp['insertion_text'])))
-            else:
-                sublime_completions.append((comp['insertion_text'],)*2)
-        return sublime_completions
+        if "extra_menu_info" in comp:
+            # We can show some extra info in the auto complete window
+            return ("{0}\t{1}".format(f(comp['insertion_text']), 
+                                      f(comp['extra_menu_info'])),
+                    f(comp['insertion_text']))
+        return (comp['insertion_text'],)*2
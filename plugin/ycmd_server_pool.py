@@ -0,0 +1,107 @@
+# Copyright (C) 2014 Ivan Koster
+# 
+# This file is part of SublimeYouCompleteMe.
+# 
+# SublimeYouCompleteMe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# SublimeYouCompleteMe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with SublimeYouCompleteMe.  If not, see <http://www.gnu.org/licenses/>.
+
+""" See the ServerPool class """
+from collections import OrderedDict
+import threading
+import time
+
+DEFAULT_MAX_SERVERS = 2
+# Longer than a request can take to be answered: requests time out after
+# 30 seconds, so an idle server has nothing in flight anymore.
+DEFAULT_MIN_IDLE_SECONDS = 120
+
+
+class ServerPool(object):
+    """ Keeps a YCMD server per project, so the translation units and
+    identifiers of one project don't fill the server of another.
+
+    key_of_file returns the project key of a file path, files with the same
+    key share a server. create_server(key) returns a new server for a key,
+    it is only started by the first request to it. When there are more than
+    max_servers, the least recently used servers that weren't used for
+    min_idle_seconds are shut down. Until then the pool has more servers.
+    """
+    def __init__(self, create_server, key_of_file,
+                 max_servers=DEFAULT_MAX_SERVERS,
+                 min_idle_seconds=DEFAULT_MIN_IDLE_SECONDS):
+        self._create_server = create_server
+        self._key_of_file = key_of_file
+        self._max_servers = max(1, max_servers)
+        self._min_idle_seconds = min_idle_seconds
+        self._lock = threading.Lock()
+        # key -> (server, time of last use), least recently used first
+        self._servers = OrderedDict()
+        self.created = 0
+        self.evicted = 0
+
+    def server_for_file(self, file_path):
+        """ The server of the project of the file, created if there is none.
+        A file_path of None gets the server of the "" key.
+        """
+        key = self._key_of_file(file_path) if file_path else ""
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            entry = self._servers.pop(key, None)
+            if entry is None:
+                server = self._create_server(key)
+                self.created += 1
+            else:
+                server = entry[0]
+            self._servers[key] = (server, now)
+            for idle_key, (idle_server, last_use) in \
+                    list(self._servers.items()):
+                if len(self._servers) <= self._max_servers or \
+                   now - last_use < self._min_idle_seconds:
+                    break # the servers after it were used more recently
+                del self._servers[idle_key]
+                evicted.append(idle_server)
+                self.evicted += 1
+        for idle_server in evicted:
+            print("Shutting down the idle YCMD of {0}".format(
+                idle_server.key or "files outside projects"))
+            idle_server.server_shutdown()
+        return server
+
+    def configure(self, max_servers, min_idle_seconds):
+        """ Change the limits of the pool, they apply from the next request
+        on.
+        """
+        with self._lock:
+            self._max_servers = max(1, max_servers)
+            self._min_idle_seconds = min_idle_seconds
+
+    def servers(self):
+        """ The servers in the pool, least recently used first """
+        with self._lock:
+            return [server for server, _ in self._servers.values()]
+
+    def stats(self):
+        """ A readable line about the servers in the pool """
+        with self._lock:
+            return "{0} of {1} servers running, {2} created, {3} shut down " \
+                   "as idle".format(len(self._servers), self._max_servers,
+                                    self.created, self.evicted)
+
+    def shutdown(self):
+        """ Shut down every server in the pool """
+        with self._lock:
+            servers = [server for server, _ in self._servers.values()]
+            self._servers.clear()
+        for server in servers:
+            server.server_shutdown()
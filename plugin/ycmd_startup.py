@@ -0,0 +1,190 @@
+# Copyright (C) 2014 Ivan Koster
+# 
+# This file is part of SublimeYouCompleteMe.
+# 
+# SublimeYouCompleteMe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# SublimeYouCompleteMe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with SublimeYouCompleteMe.  If not, see <http://www.gnu.org/licenses/>.
+
+""" See the ServerStartup class """
+from collections import deque
+from concurrent.futures import Future, CancelledError
+import threading
+import time
+
+DEFAULT_MAX_WAITING = 64
+
+
+class ServerNotReadyError(RuntimeError):
+    """ A request was dropped because too many requests were waiting for the
+    YCMD server to become ready.
+    """
+    pass
+
+
+def wait_until_ready(probe, is_alive, timeout, first_delay=0.05,
+                     max_delay=1.0):
+    """ Call probe until it returns True, waiting twice as long after every
+    failed attempt, up to max_delay. Exceptions of probe count as not ready.
+    Raises RuntimeError when is_alive returns False or after timeout seconds.
+    """
+    deadline = time.monotonic() + timeout
+    delay = first_delay
+    while True:
+        if not is_alive():
+            raise RuntimeError("YCMD exited while it was starting")
+        try:
+            if probe():
+                return
+        except Exception:
+            pass
+        if time.monotonic() + delay > deadline:
+            raise RuntimeError("YCMD wasn't ready after {0} seconds".format(
+                timeout))
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+
+class ServerStartup(object):
+    """ Starts the YCMD server in a background thread the first time a
+    request needs it, and holds the requests made before it is ready.
+
+    start is called without arguments in the background thread and returns
+    once the server can take requests, or raises if it couldn't be started.
+    At most max_waiting requests are held, when another one comes in the
+    oldest one fails with ServerNotReadyError. Newer requests are the ones
+    the user waits for, older ones are mostly superseded by then.
+    """
+    def __init__(self, start, max_waiting=DEFAULT_MAX_WAITING):
+        self._start = start
+        self._max_waiting = max_waiting
+        self._lock = threading.Lock()
+        self._ready = None # Future of the startup, None until it is started
+        self._waiting = deque() # (future, send) of the held requests
+        self.time_to_ready = None # seconds the last startup took
+        self.held = 0
+        self.dropped = 0
+        self.restarts = 0
+
+    def ready(self):
+        """ The future of the startup. Starts the server if that didn't
+        happen yet.
+        """
+        with self._lock:
+            if self._ready is None:
+                self._begin()
+            return self._ready
+
+    def restart(self):
+        """ Start the server again after it stopped or failed to start. The
+        requests are held again until it is ready. Returns the new future of
+        the startup, or the current one if the server is already starting.
+        """
+        with self._lock:
+            if self._ready is None or self._ready.done():
+                if self._ready is not None:
+                    self.restarts += 1
+                self._begin()
+            return self._ready
+
+    def _begin(self):
+        # Called with the lock held
+        self._ready = Future()
+        self._ready.set_running_or_notify_cancel()
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def is_started(self):
+        """ Was the server ever asked to start? """
+        with self._lock:
+            return self._ready is not None
+
+    def run_when_ready(self, send):
+        """ Call send, which sends a request and returns its future, as soon
+        as the server is ready. Returns a future with the same outcome as the
+        one send returns. It can be cancelled while the request is held.
+        When the server failed to start, the returned future fails with the
+        error of the startup and send isn't called.
+        """
+        ready = self.ready()
+        future = None
+        dropped = None
+        with self._lock:
+            if not ready.done():
+                future = Future()
+                self._waiting.append((future, send))
+                self.held += 1
+                if len(self._waiting) > self._max_waiting:
+                    dropped = self._waiting.popleft()[0]
+                    self.dropped += 1
+        if dropped and dropped.set_running_or_notify_cancel():
+            dropped.set_exception(ServerNotReadyError(
+                "Too many requests are waiting for YCMD to start"))
+        if future is not None:
+            return future
+        if ready.exception():
+            failed = Future()
+            failed.set_running_or_notify_cancel()
+            failed.set_exception(ready.exception())
+            return failed
+        return send()
+
+    def stats(self):
+        """ A readable line about the last startup and the held requests """
+        with self._lock:
+            if self.time_to_ready is None:
+                ready = "not ready"
+            else:
+                ready = "ready after {0:.2f} s".format(self.time_to_ready)
+            return "{0}, {1} requests held, {2} waiting, {3} dropped, {4} " \
+                   "restarts".format(ready, self.held, len(self._waiting),
+                                     self.dropped, self.restarts)
+
+    def _run(self):
+        start_time = time.monotonic()
+        try:
+            self._start()
+        except Exception as error:
+            print("YCMD could not be started: {0}".format(error))
+            with self._lock:
+                self._ready.set_exception(error)
+                waiting, self._waiting = self._waiting, deque()
+            for future, _ in waiting:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(error)
+            return
+
+        with self._lock:
+            self.time_to_ready = time.monotonic() - start_time
+            self._ready.set_result(True)
+            waiting, self._waiting = self._waiting, deque()
+        print("YCMD is ready after {0:.2f} s".format(self.time_to_ready))
+        for future, send in waiting:
+            if not future.set_running_or_notify_cancel():
+                continue # superseded while it was held
+            try:
+                sent = send()
+            except Exception as error:
+                future.set_exception(error)
+                continue
+            sent.add_done_callback(
+                lambda sent, future=future: _copy_outcome(sent, future))
+
+
+def _copy_outcome(source, target):
+    if source.cancelled():
+        target.set_exception(CancelledError())
+    elif source.exception():
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
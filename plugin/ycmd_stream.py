@@ -0,0 +1,258 @@
+# Copyright (C) 2014 Ivan Koster
+# 
+# This file is part of SublimeYouCompleteMe.
+# 
+# SublimeYouCompleteMe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# SublimeYouCompleteMe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with SublimeYouCompleteMe.  If not, see <http://www.gnu.org/licenses/>.
+
+""" See the CompletionsStreamDecoder class.
+
+Run this module with python to compare the time to the first candidate, the
+total time and the peak memory of decoding a large completions response at
+once and while it is received.
+"""
+import codecs
+import json
+import json.scanner
+import re
+
+DEFAULT_MAX_CANDIDATES = 1000
+DEFAULT_MAX_SHOWN = 100
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_INCOMPLETE = object()
+
+# Parser states
+_START = 0
+_KEY_OR_END = 1
+_COLON = 2
+_VALUE = 3
+_CANDIDATE_OR_END = 4
+_DONE = 5
+
+
+class CompletionsStreamDecoder(object):
+    """ Decodes the JSON response of the completions handler while it is
+    being received.
+
+    Each completion candidate is decoded as soon as its bytes arrived, and
+    optionally converted right away. Neither the raw body nor more than
+    max_candidates candidates are kept in memory. Candidates beyond the cap
+    are still parsed to find the rest of the response, but dropped.
+    truncated is set once the cap is reached, because YCMD is asked for the
+    same amount and a list of exactly that length was likely cut off by it.
+    Only the first max_converted candidates are converted, YCMD sends them
+    best first.
+
+    Feed it the body chunks with feed() and get the decoded response, with
+    the kept candidates in "completions", from close().
+    """
+    def __init__(self, max_candidates=0, convert=None, max_converted=0):
+        self.candidates = []
+        self.converted = []
+        self.truncated = False
+        self._max_candidates = max_candidates
+        self._convert = convert
+        self._max_converted = max_converted
+        self._utf8_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json_decoder = json.JSONDecoder()
+        self._scan_once = json.scanner.make_scanner(self._json_decoder)
+        self._text = ""
+        self._position = 0
+        self._state = _START
+        self._key = None
+        self._result = {}
+
+    def feed(self, chunk):
+        """ Decode the next chunk of bytes of the response """
+        self._text = self._text[self._position:] + \
+                     self._utf8_decoder.decode(chunk)
+        self._position = 0
+        self._parse(final=False)
+
+    def close(self):
+        """ Finish decoding and return the response """
+        self._text = self._text[self._position:] + \
+                     self._utf8_decoder.decode(b"", final=True)
+        self._position = 0
+        self._parse(final=True)
+        if self._state != _DONE:
+            raise ValueError("Incomplete completions response")
+        self._result["completions"] = self.candidates
+        return self._result
+
+    def _parse(self, final):
+        text = self._text
+        while True:
+            self._position = _WHITESPACE.match(text, self._position).end()
+            if self._position >= len(text):
+                return
+            char = text[self._position]
+            state = self._state
+
+            if state == _START:
+                self._expect(char, "{")
+                self._state = _KEY_OR_END
+            elif state == _KEY_OR_END:
+                if char == "}":
+                    self._position += 1
+                    self._state = _DONE
+                elif char == ",":
+                    self._position += 1
+                else:
+                    key = self._decode_value(final)
+                    if key is _INCOMPLETE:
+                        return
+                    self._key = key
+                    self._state = _COLON
+            elif state == _COLON:
+                self._expect(char, ":")
+                self._state = _VALUE
+            elif state == _VALUE:
+                if self._key == "completions":
+                    self._expect(char, "[")
+                    self._state = _CANDIDATE_OR_END
+                    continue
+                value = self._decode_value(final)
+                if value is _INCOMPLETE:
+                    return
+                self._result[self._key] = value
+                self._state = _KEY_OR_END
+            elif state == _CANDIDATE_OR_END:
+                if char == "]":
+                    self._position += 1
+                    self._state = _KEY_OR_END
+                elif not self._decode_candidates(final):
+                    return
+            else:
+                raise ValueError("Unexpected data after completions response")
+
+    def _expect(self, char, expected):
+        if char != expected:
+            raise ValueError("Expected {0!r} in completions response, got "
+                             "{1!r}".format(expected, char))
+        self._position += 1
+
+    def _decode_value(self, final):
+        """ Decode the JSON value at the current position, or return
+        _INCOMPLETE if more data is needed.
+        """
+        try:
+            value, end = self._json_decoder.raw_decode(self._text,
+                                                       self._position)
+        except ValueError:
+            if final:
+                raise
+            return _INCOMPLETE
+        # A number at the end of the data may continue in the next chunk
+        if end >= len(self._text) and not final and \
+           not isinstance(value, (dict, list, str)):
+            return _INCOMPLETE
+        self._position = end
+        return value
+
+    def _decode_candidates(self, final):
+        """ Decode candidates up to the end of the list or of the data.
+        This is the hot loop, so it calls the scanner directly. Returns
+        False if more data is needed.
+        """
+        text = self._text
+        scan_once = self._scan_once
+        position = self._position
+        length = len(text)
+        try:
+            while position < length:
+                char = text[position]
+                if char == "]":
+                    return True
+                if char in ", \t\n\r":
+                    position += 1
+                    continue
+                try:
+                    candidate, position = scan_once(text, position)
+                except (StopIteration, ValueError):
+                    if final:
+                        raise ValueError("Incomplete completion candidate")
+                    return False
+                if self._max_candidates and \
+                   len(self.candidates) >= self._max_candidates:
+                    self.truncated = True
+                    continue
+                self.candidates.append(candidate)
+                if len(self.candidates) == self._max_candidates:
+                    self.truncated = True
+                if self._convert and (not self._max_converted or
+                                      len(self.converted) < self._max_converted):
+                    self.converted.append(self._convert(candidate))
+            return False
+        finally:
+            self._position = position
+
+
+def benchmark(num_candidates=50000, chunk_size=64 * 1024):
+    """ Decode a completions response with many identifier candidates the
+    old way and with the stream decoder, capped and uncapped.
+    """
+    import time
+    import tracemalloc
+
+    def convert(comp):
+        return ("{0}\t{1}".format(comp["insertion_text"],
+                                  comp["extra_menu_info"]),
+                comp["insertion_text"])
+
+    body = json.dumps({
+        "completions": [{"insertion_text": "identifier_{0}".format(i),
+                         "extra_menu_info": "[ID]"}
+                        for i in range(num_candidates)],
+        "completion_start_column": 5,
+        "errors": []}).encode("utf-8")
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+    def old_path():
+        received = b"".join(chunks)
+        response = json.loads(received.decode("utf-8"))
+        first = time.perf_counter()
+        return first, [convert(comp) for comp in response["completions"]]
+
+    def stream_path(max_candidates):
+        decoder = CompletionsStreamDecoder(max_candidates, convert)
+        first = None
+        for chunk in chunks:
+            decoder.feed(chunk)
+            if first is None and decoder.converted:
+                first = time.perf_counter()
+        decoder.close()
+        return first, decoder.converted
+
+    print("{0} candidates, {1:.1f} MB".format(num_candidates,
+                                              len(body) / 1024.0 / 1024.0))
+    for name, function in [("old", old_path),
+                           ("stream", lambda: stream_path(0)),
+                           ("stream capped", lambda: stream_path(
+                               DEFAULT_MAX_CANDIDATES))]:
+        start = time.perf_counter()
+        first, _ = function()
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("{0:14} first {1:7.1f} ms total {2:7.1f} ms peak {3:6.1f} MB"
+              .format(name, (first - start) * 1000, elapsed * 1000,
+                      peak / 1024.0 / 1024.0))
+
+
+if __name__ == "__main__":
+    benchmark()
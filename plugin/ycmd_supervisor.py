@@ -0,0 +1,73 @@
+# Copyright (C) 2014 Ivan Koster
+# 
+# This file is part of SublimeYouCompleteMe.
+# 
+# SublimeYouCompleteMe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# SublimeYouCompleteMe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with SublimeYouCompleteMe.  If not, see <http://www.gnu.org/licenses/>.
+
+""" See the ServerSupervisor class """
+import threading
+import time
+
+
+class ServerSupervisor(threading.Thread):
+    """ Restarts the YCMD server when it exited or couldn't be started.
+
+    needs_restart and restart are called without arguments from this
+    thread. restart returns once the new server is ready or failed to start.
+    The wait before a restart doubles with every restart, from
+    min_backoff_seconds up to max_backoff_seconds, so a server that crashes
+    right away isn't started over and over. It goes back to the minimum
+    once a server stayed up for stable_seconds.
+    """
+    def __init__(self, needs_restart, restart, check_interval_seconds=1.0,
+                 min_backoff_seconds=1.0, max_backoff_seconds=60.0,
+                 stable_seconds=60.0):
+        super(ServerSupervisor, self).__init__()
+        self._needs_restart = needs_restart
+        self._restart = restart
+        self._check_interval_seconds = check_interval_seconds
+        self._min_backoff_seconds = min_backoff_seconds
+        self._max_backoff_seconds = max_backoff_seconds
+        self._stable_seconds = stable_seconds
+        self._stop_event = threading.Event()
+        self.daemon = True
+        self.restarts = 0
+
+    def run(self):
+        """ Start running this thread """
+        backoff = self._min_backoff_seconds
+        last_restart = None
+        while not self._stop_event.wait(self._check_interval_seconds):
+            if not self._needs_restart():
+                if last_restart is not None and \
+                   time.monotonic() - last_restart > self._stable_seconds:
+                    backoff = self._min_backoff_seconds
+                    last_restart = None
+                continue
+
+            print("YCMD stopped, restarting it in {0:.0f} s".format(backoff))
+            if self._stop_event.wait(backoff):
+                return
+            last_restart = time.monotonic()
+            backoff = min(backoff * 2, self._max_backoff_seconds)
+            try:
+                self._restart()
+            except Exception as error:
+                print("YCMD restart failed: {0}".format(error))
+                continue
+            self.restarts += 1
+
+    def stop(self):
+        """ Stop and destroy this thread """
+        self._stop_event.set()
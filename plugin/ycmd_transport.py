@@ -0,0 +1,255 @@
+# Copyright (C) 2014 Ivan Koster
+# 
+# This file is part of SublimeYouCompleteMe.
+# 
+# SublimeYouCompleteMe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# SublimeYouCompleteMe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with SublimeYouCompleteMe.  If not, see <http://www.gnu.org/licenses/>.
+
+""" The HTTP transport to the YCMD server.
+
+The server runs on localhost, so the cost of a request should be the JSON
+serialization and the time the handler needs, not setting up connections.
+The session made here keeps one connection per worker thread alive and
+reuses it, and disables Nagle's algorithm so small requests aren't delayed.
+
+On linux YCMD can also be reached over a unix domain socket, which skips the
+loopback TCP stack altogether. Every server gets its own base URI, requests
+to it go over the socket that was given to use_unix_socket() with that URI.
+"""
+import socket
+import sys
+import threading
+from urllib.parse import urlparse
+
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError
+from requests.packages.urllib3.connection import HTTPConnection
+from requests.packages.urllib3.connectionpool import HTTPConnectionPool
+from requests_futures.sessions import FuturesSession
+
+from SublimeYouCompleteMe.plugin.priority_executor import \
+     PriorityThreadPoolExecutor
+
+DEFAULT_MAX_WORKERS = 30
+# How long a worker waits for a free pooled connection before the request
+# fails, so a connection that is never returned can't block it forever
+POOL_TIMEOUT_SECONDS = 30
+UNIX_SOCKET_SCHEME = "http+unix://"
+UNIX_SOCKET_BASE_URI = UNIX_SOCKET_SCHEME + "{0}/"
+
+SOCKET_OPTIONS = [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+                  (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+
+
+class YCMDHTTPConnectionPool(HTTPConnectionPool):
+    """ A blocking connection pool that waits at most POOL_TIMEOUT_SECONDS
+    for a free connection.
+    """
+    def _get_conn(self, timeout=None):
+        if timeout is None:
+            timeout = POOL_TIMEOUT_SECONDS
+        return super(YCMDHTTPConnectionPool, self)._get_conn(timeout)
+
+
+class YCMDHTTPAdapter(HTTPAdapter):
+    """ A requests adapter with a connection pool as large as the amount of
+    worker threads, that disables Nagle's algorithm on its sockets.
+    """
+    def init_poolmanager(self, connections, maxsize, block=False,
+                         **pool_kwargs):
+        socket_options = list(HTTPConnection.default_socket_options)
+        for option in SOCKET_OPTIONS:
+            if option not in socket_options:
+                socket_options.append(option)
+        pool_kwargs["socket_options"] = socket_options
+        super(YCMDHTTPAdapter, self).init_poolmanager(connections, maxsize,
+                                                      block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": YCMDHTTPConnectionPool}
+
+    def connection_stats(self):
+        """ Returns a tuple (requests, connections) with the amount of
+        requests sent and connections opened by this adapter's pools.
+        Every request above the amount of connections reused a kept alive
+        connection.
+        """
+        pools = self.poolmanager.pools
+        num_requests = 0
+        num_connections = 0
+        for key in list(pools.keys()):
+            pool = pools.get(key, None)
+            if pool:
+                num_requests += pool.num_requests
+                num_connections += pool.num_connections
+        return num_requests, num_connections
+
+
+class UnixSocketHTTPConnection(HTTPConnection):
+    """ A HTTP connection over a unix domain socket """
+    def __init__(self, socket_path, timeout):
+        HTTPConnection.__init__(self, "localhost", timeout=timeout)
+        self._socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self._socket_path)
+        self.sock = sock
+
+
+class UnixSocketHTTPConnectionPool(YCMDHTTPConnectionPool):
+    """ A pool of connections to one unix domain socket """
+    def __init__(self, socket_path, maxsize):
+        YCMDHTTPConnectionPool.__init__(self, "localhost", maxsize=maxsize,
+                                        block=True)
+        self._socket_path = socket_path
+
+    def _new_conn(self):
+        self.num_connections += 1
+        return UnixSocketHTTPConnection(self._socket_path,
+                                        self.timeout.connect_timeout)
+
+
+class YCMDUnixSocketAdapter(HTTPAdapter):
+    """ A requests adapter for http+unix://<name>/ URLs, that sends every
+    request to the unix domain socket registered for the name. It is mounted
+    once, servers are added and removed while requests are sent from other
+    threads.
+    """
+    def __init__(self, pool_maxsize):
+        self._lock = threading.Lock()
+        self._socket_paths = {} # name -> socket path
+        self._pools = {} # name -> UnixSocketHTTPConnectionPool
+        super(YCMDUnixSocketAdapter, self).__init__(pool_connections=1,
+                                                    pool_maxsize=pool_maxsize,
+                                                    pool_block=True)
+
+    def add_socket(self, name, socket_path):
+        """ Send the requests for the name to the socket at socket_path """
+        with self._lock:
+            self._socket_paths[name] = socket_path
+            pool = self._pools.pop(name, None)
+        if pool:
+            pool.close()
+
+    def remove_socket(self, name):
+        """ Close the connections to the socket of the name """
+        with self._lock:
+            self._socket_paths.pop(name, None)
+            pool = self._pools.pop(name, None)
+        if pool:
+            pool.close()
+
+    def get_connection(self, url, proxies=None):
+        name = urlparse(url).hostname
+        with self._lock:
+            pool = self._pools.get(name, None)
+            if pool:
+                return pool
+            socket_path = self._socket_paths.get(name, None)
+            if socket_path is None:
+                raise ConnectionError("No YCMD server is listening at "
+                                      "{0}".format(url))
+            pool = UnixSocketHTTPConnectionPool(socket_path,
+                                                self._pool_maxsize)
+            self._pools[name] = pool
+            return pool
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None,
+                                        cert=None):
+        return self.get_connection(request.url, proxies)
+
+    def request_url(self, request, proxies):
+        return request.path_url
+
+    def close(self):
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for pool in pools:
+            pool.close()
+        super(YCMDUnixSocketAdapter, self).close()
+
+    def connection_stats(self):
+        """ See YCMDHTTPAdapter.connection_stats """
+        with self._lock:
+            pools = list(self._pools.values())
+        return (sum(pool.num_requests for pool in pools),
+                sum(pool.num_connections for pool in pools))
+
+
+def create_session(max_workers=DEFAULT_MAX_WORKERS):
+    """ Create a requests-futures session to talk to YCMD with max_workers
+    threads and as many pooled connections. Requests are queued in the
+    priority lanes of a PriorityThreadPoolExecutor.
+    The adapters are only mounted here, mounting changes the adapters that
+    the worker threads look up.
+    """
+    session = FuturesSession(
+        executor=PriorityThreadPoolExecutor(max_workers=max_workers))
+    adapter = YCMDHTTPAdapter(pool_connections=1, pool_maxsize=max_workers,
+                              pool_block=True)
+    session.mount("http://", adapter)
+    session.ycmd_unix_socket_adapter = YCMDUnixSocketAdapter(max_workers)
+    session.mount(UNIX_SOCKET_SCHEME, session.ycmd_unix_socket_adapter)
+    return session
+
+
+def unix_socket_base_uri(name):
+    """ The base URI of the server with the given name, when it listens on
+    a unix domain socket.
+    """
+    return UNIX_SOCKET_BASE_URI.format(name)
+
+
+def use_unix_socket(session, socket_path, base_uri):
+    """ Send the requests of a session made by create_session to base_uri,
+    made by unix_socket_base_uri, over the unix domain socket at
+    socket_path.
+    """
+    session.ycmd_unix_socket_adapter.add_socket(urlparse(base_uri).hostname,
+                                                socket_path)
+
+
+def stop_using_unix_socket(session, base_uri):
+    """ Close the connections of a session to base_uri """
+    session.ycmd_unix_socket_adapter.remove_socket(
+        urlparse(base_uri).hostname)
+
+
+def unix_sockets_supported():
+    """ Can YCMD be reached over a unix domain socket on this platform? """
+    return sys.platform.startswith("linux") and hasattr(socket, "AF_UNIX")
+
+
+def connection_stats(session):
+    """ A readable summary of the connection reuse of a session made by
+    create_session.
+    """
+    num_requests = 0
+    num_connections = 0
+    for adapter in session.adapters.values():
+        if hasattr(adapter, "connection_stats"):
+            adapter_requests, adapter_connections = adapter.connection_stats()
+            num_requests += adapter_requests
+            num_connections += adapter_connections
+    reused = max(num_requests - num_connections, 0)
+    return ("{0} requests over {1} connections, {2} reused a kept alive "
+            "connection").format(num_requests, num_connections, reused)
+
+
+def lane_stats(session):
+    """ Readable queue depth and wait times per priority lane of a session
+    made by create_session.
+    """
+    return "; ".join(session.executor.lane_stats())
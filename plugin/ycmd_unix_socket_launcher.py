@@ -0,0 +1,56 @@
+# Copyright (C) 2014 Ivan Koster
+# 
+# This file is part of SublimeYouCompleteMe.
+# 
+# SublimeYouCompleteMe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# SublimeYouCompleteMe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with SublimeYouCompleteMe.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Starts YCMD listening on a unix domain socket instead of a TCP port.
+
+YCMD itself only knows the --port argument, but the waitress server it runs
+on can listen on a unix socket. This script replaces waitress.serve before
+YCMD imports it and then runs YCMD as usual.
+
+This script is run by the python 2.7 interpreter of YCMD, not by sublime
+text. Usage:
+    python ycmd_unix_socket_launcher.py <socket path> <ycmd dir> [ycmd args]
+"""
+import os
+import runpy
+import sys
+
+
+def main():
+    """ Run YCMD with waitress patched to listen on the socket path """
+    socket_path = sys.argv[1]
+    ycmd_dir = os.path.abspath(sys.argv[2])
+    sys.path.insert(0, os.path.join(os.path.dirname(ycmd_dir), "third_party",
+                                    "waitress"))
+    import waitress
+
+    tcp_serve = waitress.serve
+
+    def serve_on_unix_socket(app, **kwargs):
+        kwargs.pop("host", None)
+        kwargs.pop("port", None)
+        kwargs["unix_socket"] = socket_path
+        kwargs["unix_socket_perms"] = "600"
+        return tcp_serve(app, **kwargs)
+
+    waitress.serve = serve_on_unix_socket
+    sys.argv = [ycmd_dir] + sys.argv[3:]
+    runpy.run_path(ycmd_dir, run_name="__main__")
+
+
+if __name__ == "__main__":
+    main()
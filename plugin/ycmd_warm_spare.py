@@ -0,0 +1,192 @@
+# Copyright (C) 2014 Ivan Koster
+# 
+# This file is part of SublimeYouCompleteMe.
+# 
+# SublimeYouCompleteMe is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# SublimeYouCompleteMe is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with SublimeYouCompleteMe.  If not, see <http://www.gnu.org/licenses/>.
+
+""" See the WarmSpare class """
+import threading
+import time
+
+from SublimeYouCompleteMe.plugin.ycmd_startup import wait_until_ready
+
+DEFAULT_PING_INTERVAL_SECONDS = 60
+DEFAULT_READY_TIMEOUT_SECONDS = 30
+DEFAULT_RELEASE_GRACE_SECONDS = 30
+
+
+class WarmSpare(object):
+    """ Keeps one started YCMD server process in reserve. A server that
+    exited, or the first server after the plugin was reloaded, takes it
+    instead of waiting for a new interpreter to import the completers.
+
+    spawn is called without arguments in a background thread and returns a
+    new process with base_uri and hmac_secret attributes and is_alive() and
+    terminate() methods. is_ready(process) tells whether it can take
+    requests. It is also called every ping_interval_seconds, so an idle spare
+    doesn't shut itself down.
+
+    When the plugin is unloaded it releases the spare. Unless the reloaded
+    plugin enables it again within release_grace_seconds, the spare is shut
+    down and the thread stops.
+    """
+    def __init__(self, ping_interval_seconds=DEFAULT_PING_INTERVAL_SECONDS,
+                 release_grace_seconds=DEFAULT_RELEASE_GRACE_SECONDS):
+        self._ping_interval_seconds = ping_interval_seconds
+        self._release_grace_seconds = release_grace_seconds
+        self._lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._thread = None
+        self._spawn = None
+        self._is_ready = None
+        self._enabled = False
+        self._released_at = None
+        self._process = None # the spare, once it is ready
+        self.spawned = 0
+        self.promoted = 0
+        self.time_to_ready = None # seconds the last spare took to start
+
+    def enable(self, spawn, is_ready):
+        """ Keep a spare, started with spawn. A reloaded plugin calls this
+        again with its own functions.
+        """
+        with self._lock:
+            self._spawn = spawn
+            self._is_ready = is_ready
+            self._enabled = True
+            self._released_at = None
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+        self._wake_event.set()
+
+    def release(self):
+        """ Keep the spare for release_grace_seconds, so a reloaded plugin
+        can take it over, and shut it down afterwards unless enable is called
+        again.
+        """
+        with self._lock:
+            if self._enabled:
+                self._released_at = time.monotonic()
+        self._wake_event.set()
+
+    def disable(self):
+        """ Stop keeping a spare and shut down the current one """
+        with self._lock:
+            self._enabled = False
+            self._released_at = None
+            process, self._process = self._process, None
+        self._wake_event.set()
+        if process:
+            process.terminate()
+
+    def take(self):
+        """ Returns the spare if one is ready, otherwise None. A new spare is
+        started in the background.
+        """
+        with self._lock:
+            process, self._process = self._process, None
+        self._wake_event.set()
+        if process is None:
+            return None
+        if not process.is_alive():
+            process.terminate()
+            return None
+        self.promoted += 1
+        return process
+
+    def stats(self):
+        """ A readable line about the spare """
+        with self._lock:
+            if not self._enabled:
+                state = "off"
+            elif self._process is None:
+                state = "starting"
+            else:
+                state = "ready"
+        if self.time_to_ready is not None:
+            state += ", started in {0:.2f} s".format(self.time_to_ready)
+        return "{0}, {1} spawned, {2} promoted".format(state, self.spawned,
+                                                       self.promoted)
+
+    def _run(self):
+        timeout = 0
+        while True:
+            self._wake_event.wait(timeout)
+            self._wake_event.clear()
+            timeout = self._ping_interval_seconds
+            with self._lock:
+                if self._released_at is not None:
+                    remaining = self._released_at + \
+                                self._release_grace_seconds - time.monotonic()
+                    if remaining <= 0:
+                        self._enabled = False
+                        self._released_at = None
+                    else:
+                        timeout = min(timeout, remaining)
+                if not self._enabled:
+                    # Stop, enable starts a new thread
+                    self._thread = None
+                    process, self._process = self._process, None
+                    break
+                process = self._process
+                spawn = self._spawn
+                is_ready = self._is_ready
+
+            if process is not None and process.is_alive():
+                try:
+                    is_ready(process)
+                except Exception:
+                    pass # It is replaced once is_alive fails
+                continue
+            if process is not None:
+                with self._lock:
+                    if self._process is process:
+                        self._process = None
+                process.terminate()
+            self._fill(spawn, is_ready)
+
+        if process:
+            process.terminate()
+
+    def _fill(self, spawn, is_ready):
+        start_time = time.monotonic()
+        try:
+            process = spawn()
+        except Exception as error:
+            print("The warm spare YCMD could not be started: {0}".format(
+                error))
+            return
+        self.spawned += 1
+        try:
+            wait_until_ready(lambda: is_ready(process), process.is_alive,
+                             DEFAULT_READY_TIMEOUT_SECONDS)
+        except Exception as error:
+            print("The warm spare YCMD could not be started: {0}".format(
+                error))
+            process.terminate()
+            return
+
+        with self._lock:
+            if self._enabled and self._process is None:
+                self._process = process
+                self.time_to_ready = time.monotonic() - start_time
+                return
+        process.terminate() # disabled while it was starting
+
+
+# Module level, so the spare outlives reloads of the plugin module that
+# uses it. Sublime Text only reloads the plugin module itself.
+WARM_SPARE = WarmSpare()